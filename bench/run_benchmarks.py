@@ -0,0 +1,430 @@
+# run_benchmarks.py
+
+"""
+Offline benchmarks for the scraper and analyzer, run against the saved corpus in
+bench/corpus served by bench/standin_server.py. Nothing here touches daft.ie.
+
+    python -m bench.run_benchmarks                     # full run, writes bench/results/<time>.json
+    python -m bench.run_benchmarks --quick             # fewer repeats
+    python -m bench.run_benchmarks --compare bench/results/baseline.json --fail-on-regression
+
+Micro-benchmarks time the parsing and analysis functions in-process. End-to-end
+benchmarks time fetch_daft_listings and POST /api/analyze against the stand-in server
+and report throughput, p50/p95 latency and peak traced memory. With --compare, p50
+times are compared with an earlier results file.
+
+The cold-start check imports src.main in fresh interpreters, as a serverless cold start
+does, and exits 1 if the p50 import time is over --import-budget-ms or if any of the
+scraping/analysis dependencies in LAZY_MODULES was imported eagerly.
+
+Every run also crawls searches whose results page 1 or 2 always fails, and exits 1 if the
+failure isn't reported in the crawl's errors or the partial result is cached.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Benchmarks run without the listing store, page cache or result cache so every run does the same work
+os.environ["LISTING_STORE"] = "0"
+os.environ["RESULT_CACHE"] = "0"
+os.environ.pop("DAFT_PAGE_CACHE_DIR", None)
+os.environ.setdefault("LOG_LEVEL", "WARNING") # Per-request INFO logs would end up in the timings
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.standin_server import StandInServer # noqa: E402
+from src.lib import alerts, daft_analyzer # noqa: E402
+from src.lib.http_client import configure_http_client # noqa: E402
+from src.lib.rate_limiter import configure_rate_limit # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEARCH_FILTERS = {"location": "wexford", "max_pages": 3}
+# The same search as an /api/analyze request body, which names the page cap maxPages
+ANALYZE_REQUEST = {"location": "wexford", "maxPages": 3}
+USER_KEYWORDS = "garden, sea view, needs renovation, planning permission"
+
+# Loaded on first use; importing the app must not pull them in
+LAZY_MODULES = ("bs4", "lxml", "requests", "numpy", "multiprocessing")
+DEFAULT_IMPORT_BUDGET_MS = 750.0
+
+# Synthetic saved searches the alert index is benchmarked with
+ALERT_SEARCHES = 2000
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile (q in 0..100) of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100.0
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(samples, items_per_run=1):
+    """Timing summary for per-run durations in seconds."""
+    ordered = sorted(samples)
+    mean = sum(ordered) / len(ordered)
+    return {
+        "runs": len(ordered),
+        "mean_ms": round(mean * 1000, 4),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "items_per_run": items_per_run,
+        "items_per_sec": round(items_per_run / mean, 2) if mean else None,
+    }
+
+
+def time_runs(func, repeat, number=1, items_per_call=1):
+    """Calls func number times per run, repeat runs; returns a summary of seconds per call."""
+    func() # Warm-up: imports, regex compilation, connection pools
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return summarize(samples, items_per_call)
+
+
+def peak_memory_kb(func):
+    """Peak memory traced by tracemalloc during one call, in KiB."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+# --- micro-benchmarks ---
+
+def micro_benchmarks(server, repeat):
+    search_pages, detail_pages = server.search_pages, server.detail_pages
+    parsed_details = [daft_analyzer.parse_property_page(page, f"{server.base_url}/for-sale/x/{i}")
+                      for i, page in enumerate(detail_pages)]
+    search_listings = []
+    for page in search_pages:
+        search_listings.extend(daft_analyzer.extract_search_page_listings(page))
+    batch = [dict(details, url=f"{details['url']}-{i}") for i in range(20) for details in search_listings]
+    filters = {"location": "Wexford, Gorey", "keywords": "sea view", "minPrice": "200000", "maxPrice": "450000"}
+
+    saved_searches = _saved_searches(ALERT_SEARCHES)
+    alert_index = alerts.AlertIndex(saved_searches)
+
+    def parse_detail_pages():
+        for i, page in enumerate(detail_pages):
+            daft_analyzer.parse_property_page(page, f"{server.base_url}/for-sale/x/{i}")
+
+    def parse_search_pages():
+        for page in search_pages:
+            daft_analyzer._parse_search_page_job(page) # What the crawl runs per results page
+
+    def analyze_descriptions():
+        for details in parsed_details:
+            daft_analyzer.analyze_property_description(copy.copy(details))
+
+    return {
+        "scrape_property_details_parse": time_runs(parse_detail_pages, repeat, items_per_call=len(detail_pages)),
+        "search_page_parse": time_runs(parse_search_pages, repeat, items_per_call=len(search_pages)),
+        "analyze_property_description": time_runs(analyze_descriptions, repeat, number=20,
+                                                  items_per_call=len(parsed_details)),
+        "analyze_listings": time_runs(lambda: daft_analyzer.analyze_listings(batch, ""), repeat,
+                                      items_per_call=len(batch)),
+        "analyze_listings_with_keywords": time_runs(lambda: daft_analyzer.analyze_listings(batch, USER_KEYWORDS),
+                                                    repeat, items_per_call=len(batch)),
+        "alert_index_match": time_runs(lambda: alert_index.match_batch(batch), repeat, items_per_call=len(batch)),
+        "alert_index_build": time_runs(lambda: alerts.AlertIndex(saved_searches), repeat,
+                                       items_per_call=len(saved_searches)),
+        "construct_search_url": time_runs(lambda: daft_analyzer.construct_search_url(filters), repeat,
+                                          number=1000),
+    }
+
+
+def _saved_searches(count):
+    """Deterministic saved searches over the corpus' places, prices and keywords."""
+    rnd = random.Random(17)
+    places = ["wexford", "gorey", "enniscorthy", "new ross", "cork", "dublin", "galway", "kerry"]
+    keywords = ["", "", "", "garden", "sea view", "needs renovation, planning permission", "auction"]
+    searches = []
+    for search_id in range(count):
+        filters = {
+            "location": rnd.choice(["", *places]),
+            "minPrice": rnd.choice(["", "100000", "200000", "300000"]),
+            "maxPrice": rnd.choice(["", "250000", "400000", "600000"]),
+            "minBeds": rnd.choice(["", "2", "3"]),
+            "maxBeds": rnd.choice(["", "4", "5"]),
+            "propertyType": rnd.choice(["any", "house", "apartment"]),
+        }
+        searches.append(alerts.compile_search(search_id, filters, rnd.choice(keywords)))
+    return searches
+
+
+# --- end-to-end benchmarks ---
+
+def _end_to_end(server, name, func, repeat, count_items):
+    """Times repeated calls of func (which returns its result) and adds request counts and peak memory."""
+    func() # Warm-up
+    samples, items = [], 0
+    server.reset_stats()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+        items = count_items(result)
+    server_stats = server.stats()
+    peak = peak_memory_kb(func)
+    summary = summarize(samples, items)
+    summary["requests_per_run"] = round(server_stats["requests"] / repeat, 2)
+    summary["throttled_per_run"] = round(server_stats["throttled"] / repeat, 2)
+    summary["peak_memory_kb"] = peak
+    print(f"[run_benchmarks] {name}: p50 {summary['p50_ms']:.1f} ms, {summary['items_per_sec']} listings/s")
+    return summary
+
+
+def end_to_end_benchmarks(server, throttled_server, repeat):
+    def fetch(target, need_description):
+        def run():
+            daft_analyzer.DAFT_BASE_URL = target.base_url
+            return daft_analyzer.fetch_daft_listings(dict(SEARCH_FILTERS), need_description=need_description)
+        return run
+
+    from src import main as app_module # Imported late so the environment above applies
+    client = app_module.app.test_client()
+
+    def analyze(keywords):
+        def run():
+            daft_analyzer.DAFT_BASE_URL = server.base_url
+            response = client.post("/api/analyze", json=dict(ANALYZE_REQUEST, keywords=keywords))
+            return response.get_json()
+        return run
+
+    def analyze_cached(keywords):
+        run = analyze(keywords)
+
+        def run_cached(): # Repeats of one search, answered by the result cache after the warm-up
+            app_module.RESULT_CACHE_ENABLED = True
+            try:
+                return run()
+            finally:
+                app_module.RESULT_CACHE_ENABLED = False
+        return run_cached
+
+    results = {
+        "fetch_daft_listings_search_pages": _end_to_end(server, "fetch_daft_listings (search pages only)",
+                                                        fetch(server, False), repeat, len),
+        "fetch_daft_listings_with_details": _end_to_end(server, "fetch_daft_listings (with detail pages)",
+                                                        fetch(server, True), repeat, len),
+        "fetch_daft_listings_with_429s": _end_to_end(throttled_server, "fetch_daft_listings (429 injection)",
+                                                     fetch(throttled_server, True), repeat, len),
+        "api_analyze": _end_to_end(server, "POST /api/analyze", analyze(""), repeat,
+                                   lambda body: len(body.get("results", []))),
+        "api_analyze_with_keywords": _end_to_end(server, "POST /api/analyze (keywords)", analyze(USER_KEYWORDS),
+                                                 repeat, lambda body: len(body.get("results", []))),
+        "api_analyze_cached": _end_to_end(server, "POST /api/analyze (result cache)", analyze_cached(USER_KEYWORDS),
+                                          repeat, lambda body: len(body.get("results", []))),
+    }
+    app_module.result_cache.clear()
+    daft_analyzer.DAFT_BASE_URL = "https://www.daft.ie"
+    return results
+
+
+# --- cold start ---
+
+_COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import src.main
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "loaded": [name for name in %r if name in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def cold_start_benchmark(repeat):
+    """Times `import src.main` in repeat fresh interpreters and lists the lazy modules it loaded."""
+    samples, loaded = [], set()
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", _COLD_START_SCRIPT], cwd=REPO_DIR, env=os.environ,
+                                   capture_output=True, text=True, timeout=120)
+        if completed.returncode != 0:
+            raise RuntimeError(f"importing src.main failed:\n{completed.stderr}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded.update(result["loaded"])
+    summary = summarize(samples)
+    summary["eager_lazy_modules"] = sorted(loaded)
+    print(f"[run_benchmarks] import src.main: p50 {summary['p50_ms']:.1f} ms"
+          + (f", eagerly loaded {', '.join(summary['eager_lazy_modules'])}" if loaded else ""))
+    return {"import_src_main": summary}
+
+
+def check_import_budget(cold_start, budget_ms):
+    """Returns the cold-start problems: over budget, or lazy modules imported at startup."""
+    summary = cold_start["import_src_main"]
+    problems = []
+    if summary["p50_ms"] > budget_ms:
+        problems.append(f"import src.main p50 {summary['p50_ms']:.1f} ms is over the {budget_ms:.0f} ms budget")
+    if summary["eager_lazy_modules"]:
+        problems.append(f"import src.main loads {', '.join(summary['eager_lazy_modules'])}, which should load lazily")
+    return problems
+
+
+# --- failed results pages ---
+
+def check_failed_pages(latency):
+    """
+    Crawls a search whose results page 1, then page 2, always answers 503 and returns the
+    problems with how that is reported: the page must be in fetch_daft_listings' errors and
+    in the errors of POST /api/analyze, and the partial result must not be cached.
+    """
+    from src import main as app_module # Imported late so the environment above applies
+
+    problems = []
+    client = app_module.app.test_client()
+    for failed_page in (1, 2):
+        with StandInServer(latency=latency, retry_after=0, fail_search_pages={failed_page}) as server:
+            daft_analyzer.DAFT_BASE_URL = server.base_url
+            app_module.RESULT_CACHE_ENABLED = True
+            try:
+                errors = []
+                listings = daft_analyzer.fetch_daft_listings(dict(SEARCH_FILTERS), errors=errors)
+                if not any(error.get("page") == failed_page for error in errors):
+                    problems.append(f"fetch_daft_listings returned {len(listings)} listings "
+                                    f"without the failed page {failed_page} in errors")
+                for _ in range(2):
+                    response = client.post("/api/analyze", json=ANALYZE_REQUEST)
+                    if not any(error.get("page") == failed_page for error in response.get_json().get("errors", [])):
+                        problems.append(f"POST /api/analyze left the failed page {failed_page} out of its errors")
+                    if response.headers.get("X-Cache") != "MISS":
+                        problems.append(f"POST /api/analyze cached a crawl whose page {failed_page} failed")
+            finally:
+                app_module.RESULT_CACHE_ENABLED = False
+                app_module.result_cache.clear()
+                daft_analyzer.DAFT_BASE_URL = "https://www.daft.ie"
+    return problems
+
+
+# --- reporting ---
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Prints p50 changes against a baseline results dict. Returns the names that regressed."""
+    regressions = []
+    for section in ("micro", "end_to_end", "cold_start"):
+        for name, current in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name)
+            if not previous or not previous.get("p50_ms"):
+                continue
+            change = (current["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"]
+            marker = ""
+            if change > threshold:
+                marker = "  <-- REGRESSION"
+                regressions.append(f"{section}.{name}")
+            print(f"[run_benchmarks] {section}.{name}: {previous['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms "
+                  f"({change:+.1%}){marker}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scraper/analyzer benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="Fewer repeats, for a fast sanity check")
+    parser.add_argument("--repeat", type=int, help="Runs per micro-benchmark (default 50, 10 with --quick)")
+    parser.add_argument("--e2e-repeat", type=int, help="Runs per end-to-end benchmark (default 10, 3 with --quick)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stand-in server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Stand-in server jitter in seconds")
+    parser.add_argument("--rate-429", type=float, default=0.1, help="429 fraction for the throttled scenario")
+    parser.add_argument("--rate-limit", type=float, default=1000.0,
+                        help="Client requests/sec per host (the production default is far lower)")
+    parser.add_argument("--skip-e2e", action="store_true", help="Skip the end-to-end benchmarks")
+    parser.add_argument("--cold-start-repeat", type=int,
+                        help="Fresh interpreters timed importing the app (default 15, 5 with --quick; 0 skips)")
+    parser.add_argument("--import-budget-ms", type=float, default=DEFAULT_IMPORT_BUDGET_MS,
+                        help="Exit 1 if the p50 cold import of src.main takes longer")
+    parser.add_argument("--output", help="Results file (default bench/results/<UTC time>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare p50 times with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if anything regressed")
+    args = parser.parse_args(argv)
+
+    repeat = args.repeat or (10 if args.quick else 50)
+    e2e_repeat = args.e2e_repeat or (3 if args.quick else 10)
+    cold_start_repeat = args.cold_start_repeat if args.cold_start_repeat is not None else (5 if args.quick else 15)
+    configure_rate_limit(args.rate_limit, max(1, int(args.rate_limit)))
+    configure_http_client() # A fresh client without the page cache
+
+    started = datetime.now(timezone.utc)
+    results = {
+        "meta": {
+            "started_at": started.isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+    }
+    server = StandInServer(latency=args.latency, jitter=args.jitter, seed=1).start()
+    throttled_server = StandInServer(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+                                     retry_after=0, seed=2).start()
+    try:
+        if cold_start_repeat > 0: # First, before this process warms the OS file cache any further
+            print("[run_benchmarks] Running cold-start benchmark...")
+            results["cold_start"] = cold_start_benchmark(cold_start_repeat)
+        print("[run_benchmarks] Running micro-benchmarks...")
+        results["micro"] = micro_benchmarks(server, repeat)
+        for name, summary in results["micro"].items():
+            print(f"[run_benchmarks] {name}: p50 {summary['p50_ms']:.3f} ms, {summary['items_per_sec']} items/s")
+        if not args.skip_e2e:
+            print("[run_benchmarks] Running end-to-end benchmarks...")
+            results["end_to_end"] = end_to_end_benchmarks(server, throttled_server, e2e_repeat)
+    finally:
+        server.stop()
+        throttled_server.stop()
+    print("[run_benchmarks] Checking how failed results pages are reported...")
+    page_problems = check_failed_pages(args.latency)
+    results["meta"]["duration_seconds"] = round((datetime.now(timezone.utc) - started).total_seconds(), 2)
+
+    output = args.output or os.path.join(RESULTS_DIR, started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[run_benchmarks] Results written to {output}")
+
+    status = 0
+    if "cold_start" in results:
+        for problem in check_import_budget(results["cold_start"], args.import_budget_ms):
+            print(f"[run_benchmarks] COLD START: {problem}")
+            status = 1
+    for problem in page_problems:
+        print(f"[run_benchmarks] FAILED PAGES: {problem}")
+        status = 1
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"[run_benchmarks] {len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
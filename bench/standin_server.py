@@ -0,0 +1,187 @@
+# standin_server.py
+
+"""
+Local stand-in for daft.ie that serves the saved pages in bench/corpus.
+
+    /property-for-sale/<location>[?from=N]  -> search_page_<N / 20 + 1>.html
+    /for-sale/<slug>/<listing id>           -> detail_<listing id % 6>.html
+    /__stats                                -> JSON request counters
+
+Every response is delayed by `latency` seconds plus up to `jitter` seconds, and a
+`rate_429` fraction of requests is answered with 429 and a Retry-After header. Results
+pages numbered in `fail_search_pages` always get a 503, for checking how a crawl reports them.
+
+Run it on its own with:
+    python -m bench.standin_server --port 8800 --latency 0.05 --jitter 0.02 --rate-429 0.05
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+SEARCH_PAGE_SIZE = 20
+
+_FROM_RE = re.compile(r'[?&]from=(\d+)')
+_LISTING_ID_RE = re.compile(r'/(\d+)/?(?:\?.*)?$')
+
+
+def load_corpus(directory=CORPUS_DIR):
+    """Returns (search pages in order, detail pages in order) as bytes."""
+    names = sorted(os.listdir(directory))
+    def read(prefix):
+        pages = sorted((name for name in names if name.startswith(prefix) and name.endswith(".html")),
+                       key=lambda name: int(name[len(prefix):-len(".html")]))
+        return [open(os.path.join(directory, name), "rb").read() for name in pages]
+    return read("search_page_"), read("detail_")
+
+
+class StandInServer:
+    """Threaded HTTP server serving the corpus; use start()/stop() or `with StandInServer() as server`."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, rate_429=0.0, retry_after=1,
+                 corpus_dir=CORPUS_DIR, seed=None, fail_search_pages=()):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.fail_search_pages = set(fail_search_pages)
+        self.search_pages, self.detail_pages = load_corpus(corpus_dir)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "search_pages": 0, "detail_pages": 0, "throttled": 0, "not_found": 0,
+                       "failed": 0, "bytes_sent": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def _delay_and_throttle(self):
+        """Sleeps for the configured latency; returns True if this request should get a 429."""
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            throttle = self.rate_429 > 0 and self._random.random() < self.rate_429
+        if delay:
+            time.sleep(delay)
+        return throttle
+
+    def _page_for(self, path):
+        if path.startswith("/property-for-sale"):
+            match = _FROM_RE.search(path)
+            index = int(match.group(1)) // SEARCH_PAGE_SIZE if match else 0
+            if index + 1 in self.fail_search_pages:
+                return "failed", None
+            if index < len(self.search_pages):
+                return "search_pages", self.search_pages[index]
+            return None, None
+        match = _LISTING_ID_RE.search(path)
+        if path.startswith("/for-sale/") and match:
+            return "detail_pages", self.detail_pages[int(match.group(1)) % len(self.detail_pages)]
+        return None, None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like the real site
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count(bytes_sent=len(body))
+
+            def do_GET(self):
+                if self.path == "/__stats":
+                    self._send(200, json.dumps(server.stats()).encode("utf-8"), "application/json")
+                    return
+                server._count(requests=1)
+                if server._delay_and_throttle():
+                    server._count(throttled=1)
+                    self._send(429, b"Too Many Requests", "text/plain", {"Retry-After": str(server.retry_after)})
+                    return
+                kind, body = server._page_for(self.path)
+                if kind == "failed":
+                    server._count(failed=1)
+                    self._send(503, b"Service Unavailable", "text/plain", {"Retry-After": str(server.retry_after)})
+                    return
+                if body is None:
+                    server._count(not_found=1)
+                    self._send(404, b"Not Found", "text/plain")
+                    return
+                server._count(**{kind: 1})
+                self._send(200, body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the saved Daft corpus locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra random seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429")
+    args = parser.parse_args()
+
+    server = StandInServer(args.host, args.port, args.latency, args.jitter, args.rate_429, args.retry_after)
+    print(f"[standin_server] Serving {len(server.search_pages)} search pages and {len(server.detail_pages)} "
+          f"detail pages on {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
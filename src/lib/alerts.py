@@ -0,0 +1,361 @@
+# alerts.py
+
+import hashlib
+import json
+import logging
+import secrets
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from src.lib.daft_analyzer import listing_id_from_url, parse_leading_int, parse_price
+from src.lib.keyword_matcher import KeywordMatcher, normalize_keywords
+from src.lib.listing_store import _chunks, normalize_place, split_address
+from src.lib.metrics import timed
+from src.lib.notifications import SEND_ERRORS, build_message, get_sender
+from src.models.saved_search import AlertMatch, SavedSearch
+from src.models.user import User, db
+
+logger = logging.getLogger(__name__)
+
+# The analyze filters a saved search keeps; paging and crawl options don't apply to alerts
+SAVED_FILTER_KEYS = ("location", "propertyType", "minPrice", "maxPrice", "minBeds", "maxBeds")
+
+# Listings spelled out in one alert message; the rest are only counted
+MAX_LISTINGS_PER_ALERT = 50
+
+_INF = float("inf")
+
+
+def compile_search(search_id, filters, keywords=""):
+    """
+    Turns a saved search into the criteria the index works on, with the same meaning as
+    listing_store.query_listings: every location term must be the listing's county or
+    area, price and beds bounds are inclusive, and propertyType is a substring match.
+    With keywords, at least one of them must appear in the title or description.
+    """
+    location = (filters.get("location") or "").strip()
+    places = ()
+    if location and location.lower() != "ireland":
+        places = tuple(sorted({normalize_place(part) for part in location.split(",")} - {""}))
+    property_type = (filters.get("propertyType") or "").strip().lower()
+    return {
+        "id": search_id,
+        "places": places,
+        "price": (parse_price(str(filters.get("minPrice") or "")), parse_price(str(filters.get("maxPrice") or ""))),
+        "beds": (parse_leading_int(str(filters.get("minBeds") or "")), parse_leading_int(str(filters.get("maxBeds") or ""))),
+        "property_type": property_type if property_type not in ("", "any") else None,
+        "keywords": normalize_keywords(keywords),
+    }
+
+
+def _listing_text(details):
+    return (details.get("description", "") + " " + details.get("title", "")).lower()
+
+
+class IntervalTree:
+    """
+    Centered interval tree over closed intervals (low, high, item); a None bound is open-ended.
+    stab(x) returns the set of items of every interval containing x in O(log n + matches).
+    Items sharing an interval (saved searches mostly use round prices) are stored as one group.
+    Empty intervals (low > high, e.g. a minimum above the maximum) never match and are dropped.
+    """
+
+    def __init__(self, intervals):
+        groups = defaultdict(set)
+        for low, high, item in intervals:
+            groups[(-_INF if low is None else low, _INF if high is None else high)].add(item)
+        self._root = self._build([(low, high, frozenset(items)) for (low, high), items in groups.items() if low <= high])
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        endpoints = sorted(value for low, high, _ in intervals for value in (low, high) if abs(value) != _INF)
+        center = endpoints[len(endpoints) // 2] if endpoints else 0
+        left, right, here = [], [], []
+        for interval in intervals:
+            if interval[1] < center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        by_low = sorted(((low, items) for low, _, items in here), key=lambda entry: entry[0])
+        by_high = sorted(((high, items) for _, high, items in here), key=lambda entry: -entry[0])
+        return (center, by_low, by_high, self._build(left), self._build(right))
+
+    def stab(self, x):
+        found = set()
+        node = self._root
+        while node is not None:
+            center, by_low, by_high, left, right = node
+            if x < center: # Intervals here all reach the center; those starting at or before x contain it
+                for low, items in by_low:
+                    if low > x:
+                        break
+                    found.update(items)
+                node = left
+            elif x > center:
+                for high, items in by_high:
+                    if high < x:
+                        break
+                    found.update(items)
+                node = right
+            else:
+                for _, items in by_low:
+                    found.update(items)
+                break
+        return found
+
+
+class AlertIndex:
+    """
+    Every active saved search compiled into inverted indexes, so a listing is matched against
+    all of them at once instead of search by search:
+      location  place -> searches naming it, with a count of the terms each search requires
+      price     interval tree over [minPrice, maxPrice]
+      beds      interval tree over [minBeds, maxBeds]
+      type      property type -> searches
+      keywords  one KeywordMatcher over every search's keywords, tagged with search ids,
+                run only when a candidate search has keywords
+    Searches without a given filter sit in that dimension's "any" set.
+    """
+
+    def __init__(self, searches):
+        self.size = len(searches)
+        self._by_place = defaultdict(set)
+        self._place_count = {}
+        self._anywhere = set()
+        self._by_type = defaultdict(set)
+        self._any_type = set()
+        for criteria in searches:
+            search_id = criteria["id"]
+            if criteria["places"]:
+                self._place_count[search_id] = len(criteria["places"])
+                for place in criteria["places"]:
+                    self._by_place[place].add(search_id)
+            else:
+                self._anywhere.add(search_id)
+            if criteria["property_type"]:
+                self._by_type[criteria["property_type"]].add(search_id)
+            else:
+                self._any_type.add(search_id)
+        self._price_tree, self._any_price = self._range_index(searches, "price")
+        self._beds_tree, self._any_beds = self._range_index(searches, "beds")
+        keywords_by_search = {criteria["id"]: criteria["keywords"] for criteria in searches if criteria["keywords"]}
+        self._keyword_searches = set(keywords_by_search)
+        self._keywords = KeywordMatcher(keywords_by_search) if keywords_by_search else None
+
+    @staticmethod
+    def _range_index(searches, key):
+        bounded = [(low, high, criteria["id"]) for criteria in searches for low, high in [criteria[key]]
+                   if low is not None or high is not None]
+        unbounded = {criteria["id"] for criteria in searches if criteria[key] == (None, None)}
+        return IntervalTree(bounded), unbounded
+
+    @staticmethod
+    def _in_range(tree, unbounded, value):
+        if value is None: # e.g. "Price on application" only matches searches without a price filter
+            return unbounded
+        return unbounded | tree.stab(value)
+
+    def match(self, details):
+        """Returns the ids of the saved searches a listing matches."""
+        area, county = split_address(details.get("title"))
+        hits = Counter()
+        for place in {area, county} - {""}:
+            hits.update(self._by_place.get(place, ()))
+        candidates = self._anywhere.union(search_id for search_id, count in hits.items()
+                                          if count == self._place_count[search_id])
+        if not candidates:
+            return candidates
+
+        property_type = (details.get("property_type") or "").lower()
+        by_type = set(self._any_type)
+        for wanted, search_ids in self._by_type.items():
+            if wanted in property_type:
+                by_type |= search_ids
+        candidates &= by_type
+        if candidates:
+            candidates &= self._in_range(self._price_tree, self._any_price, parse_price(details.get("price")))
+        if candidates:
+            candidates &= self._in_range(self._beds_tree, self._any_beds, parse_leading_int(details.get("beds")))
+
+        if candidates & self._keyword_searches:
+            found = set()
+            for keyword in self._keywords.find_keywords(_listing_text(details)):
+                found.update(self._keywords.keyword_tags[keyword])
+            candidates = {search_id for search_id in candidates
+                          if search_id not in self._keyword_searches or search_id in found}
+        return candidates
+
+    def match_batch(self, listings):
+        """Returns {(search id, listing id): details} for a batch of listings."""
+        matched = {}
+        for details in listings:
+            listing_id = details.get("listing_id") or listing_id_from_url(details.get("url"))
+            if not listing_id:
+                continue
+            for search_id in self.match(details):
+                matched[(search_id, str(listing_id))] = details
+        return matched
+
+
+# --- saved searches ---
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def save_search(email, filters, keywords="", name=""):
+    """
+    Stores a saved search for the user with this email (created if new). Returns
+    (search, token); the token is needed to list or delete the search and is only stored hashed.
+    """
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        user = User(username=email[:80], email=email)
+        db.session.add(user)
+    token = secrets.token_urlsafe(24)
+    search = SavedSearch(
+        user=user, name=name or "",
+        filters_json=json.dumps({key: filters.get(key) for key in SAVED_FILTER_KEYS if filters.get(key) not in (None, "")}),
+        keywords=", ".join(normalize_keywords(keywords)),
+        token_hash=_token_hash(token),
+    )
+    db.session.add(search)
+    db.session.commit()
+    return search, token
+
+
+def list_searches(tokens):
+    """Returns the active saved searches these tokens were issued for."""
+    hashes = [_token_hash(token) for token in tokens if token]
+    if not hashes:
+        return []
+    return SavedSearch.query.filter(SavedSearch.token_hash.in_(hashes), SavedSearch.active.is_(True)) \
+        .order_by(SavedSearch.id).all()
+
+
+def delete_search(search_id, token):
+    """Deactivates a saved search if token is the one issued for it. Returns False otherwise."""
+    if not token:
+        return False
+    search = SavedSearch.query.filter(SavedSearch.id == search_id, SavedSearch.token_hash == _token_hash(token),
+                                      SavedSearch.active.is_(True)).first()
+    if search is None:
+        return False
+    search.active = False
+    search.updated_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+_index_lock = threading.Lock()
+_index_cache = {"stamp": None, "index": None}
+
+
+def current_index():
+    """The AlertIndex of all active saved searches, rebuilt only after saved searches change."""
+    stamp = tuple(db.session.query(db.func.count(SavedSearch.id), db.func.max(SavedSearch.updated_at)).one())
+    with _index_lock:
+        if _index_cache["stamp"] != stamp:
+            searches = SavedSearch.query.filter(SavedSearch.active.is_(True)).all()
+            _index_cache["index"] = AlertIndex([compile_search(search.id, search.filters, search.keywords)
+                                                for search in searches])
+            _index_cache["stamp"] = stamp
+            logger.info("Built the alert index for %d saved searches.", len(searches))
+        return _index_cache["index"]
+
+
+# --- matching and notifying ---
+
+def process_listings(listings):
+    """
+    Matches a batch of crawled listings against every active saved search in one pass,
+    records the new matches (a listing is alerted at most once per saved search) and sends
+    the pending alerts. Returns the number of new matches.
+    """
+    index = current_index()
+    if not index.size or not listings:
+        return 0
+    with timed("alerts"):
+        matched = index.match_batch(listings)
+    if not matched:
+        return 0
+
+    listing_ids = sorted({listing_id for _, listing_id in matched})
+    seen = set()
+    for chunk in _chunks(listing_ids):
+        rows = db.session.query(AlertMatch.saved_search_id, AlertMatch.listing_id) \
+            .filter(AlertMatch.listing_id.in_(chunk)).all()
+        seen.update((row.saved_search_id, row.listing_id) for row in rows)
+    now = datetime.utcnow()
+    new_matches = [{
+        "saved_search_id": search_id, "listing_id": listing_id, "matched_at": now,
+        "url": details.get("url", ""), "title": details.get("title", ""), "price": details.get("price", ""),
+    } for (search_id, listing_id), details in matched.items() if (search_id, listing_id) not in seen]
+    if new_matches:
+        db.session.bulk_insert_mappings(AlertMatch, new_matches)
+        db.session.commit()
+        logger.info("%d new saved-search matches in a batch of %d listings.", len(new_matches), len(listings))
+        send_pending()
+    return len(new_matches)
+
+
+def _alert_body(matches):
+    lines = ["New listings match your saved searches on Value Finder.", ""]
+    listed = 0
+    for search, search_matches in matches.items():
+        lines.append(f"{search.name or f'Saved search #{search.id}'} ({len(search_matches)} new)")
+        for match in search_matches:
+            if listed == MAX_LISTINGS_PER_ALERT:
+                break
+            lines.append(f"  - {match.title} - {match.price}")
+            lines.append(f"    {match.url}")
+            listed += 1
+        lines.append("")
+    total = sum(len(search_matches) for search_matches in matches.values())
+    if total > listed:
+        lines.append(f"...and {total - listed} more.")
+    return "\n".join(lines)
+
+
+_send_lock = threading.Lock() # One sender at a time, so concurrent batches don't alert twice
+
+
+def send_pending(sender=None):
+    """
+    Sends one message per user covering all their matches not yet notified, through
+    `sender` or the configured notifications backend. A failed send leaves those matches
+    pending for the next batch. Returns the number of messages sent.
+    """
+    sender = sender or get_sender()
+    with _send_lock:
+        rows = db.session.query(AlertMatch, SavedSearch, User) \
+            .join(SavedSearch, AlertMatch.saved_search_id == SavedSearch.id) \
+            .join(User, SavedSearch.user_id == User.id) \
+            .filter(AlertMatch.notified_at.is_(None), SavedSearch.active.is_(True)) \
+            .order_by(User.email, SavedSearch.id, AlertMatch.matched_at).all()
+        by_email = defaultdict(dict)
+        for match, search, user in rows:
+            by_email[user.email].setdefault(search, []).append(match)
+
+        sent = 0
+        for email, matches in by_email.items():
+            count = sum(len(search_matches) for search_matches in matches.values())
+            message = build_message(email, f"{count} new listing{'s' if count != 1 else ''} for your saved searches",
+                                    _alert_body(matches))
+            try:
+                with timed("notify"):
+                    sender.send(message)
+            except SEND_ERRORS as e:
+                logger.warning("Could not send alert to %s, will retry: %s", email, e)
+                continue
+            now = datetime.utcnow()
+            for search_matches in matches.values():
+                for match in search_matches:
+                    match.notified_at = now
+            db.session.commit()
+            sent += 1
+        return sent
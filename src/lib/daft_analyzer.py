@@ -1,23 +1,42 @@
 # daft_analyzer.py
 
-import requests
-from bs4 import BeautifulSoup
+import importlib.util
 import json
+import logging
+import os
+import re
 import time
-import re # For case-insensitive keyword matching
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from src.lib.keyword_matcher import get_user_keyword_matcher, load_matcher, normalize_keywords
+from src.lib.metrics import ERRORS, LISTINGS, PAGES, record_stage, submit_with_context, timed
+from src.lib.parse_pool import run_parse
+
+# requests, bs4 and lxml are imported on the first scrape rather than here: the app imports this
+# module for its search keys and field parsers, and a cold start shouldn't pay for the scraping stack
+
+# lxml is a C parser, several times faster than html.parser; find_spec checks for it without importing it
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+
+logger = logging.getLogger(__name__)
 
 # Base URL for Daft.ie searches
 DAFT_BASE_URL = "https://www.daft.ie"
 
-# Headers to mimic a browser visit
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-    'Accept-Language': 'en-US,en;q=0.9',
-    'Accept-Encoding': 'gzip, deflate, br',
-    'Connection': 'keep-alive',
-    'Upgrade-Insecure-Requests': '1',
-    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9'
-}
+# Default number of detail pages scraped concurrently (override with filters["max_workers"])
+DETAIL_FETCH_WORKERS = 4
+
+# Results pages crawled when filters["max_pages"] isn't given; "all" (or 0) crawls every page
+DEFAULT_MAX_PAGES = os.getenv("DAFT_MAX_PAGES", "1")
+
+# Results pages fetched concurrently once the first page has said how many there are
+SEARCH_PAGE_WORKERS = 4
+
+# Detail pages are only fetched for user keywords by default, so the predefined tags below are
+# matched against the search page snippet; DAFT_FETCH_DETAILS=1 fetches them for every search
+FETCH_DETAILS = os.getenv("DAFT_FETCH_DETAILS", "0") != "0"
 
 # --- Analysis Keywords (from daft_scraping_strategy.md) ---
 FIXER_UPPER_KEYWORDS = [
@@ -40,92 +59,113 @@ QUICK_SALE_KEYWORDS = [
 ]
 # --- End Analysis Keywords ---
 
+# One regex pass tags a listing with every predefined tag. Loaded from the snapshot written by
+# `python -m src.lib.keyword_matcher` when it matches these lists, else built here
+ANALYSIS_MATCHER = load_matcher("analysis_tags", {
+    "Tag: Fixer-Upper": FIXER_UPPER_KEYWORDS,
+    "Tag: Development Land": LAND_DEVELOPMENT_KEYWORDS,
+    "Tag: Potential Quick Sale": QUICK_SALE_KEYWORDS,
+})
+
+_LISTING_ID_RE = re.compile(r'/(\d+)/?(?:[?#].*)?$')
+_DIGITS_RE = re.compile(r'\d[\d,]*')
+_LEADING_INT_RE = re.compile(r'\d+')
+
+def listing_id_from_url(url):
+    """Daft listing URLs end in the numeric listing id, e.g. /for-sale/.../5600483."""
+    match = _LISTING_ID_RE.search(url or "")
+    return match.group(1) if match else None
+
+def parse_price(price):
+    """Returns the euro amount in a price string such as "€325,000" or "AMV: €250,000", or None."""
+    match = _DIGITS_RE.search(price or "")
+    if not match:
+        return None
+    return int(match.group(0).replace(",", ""))
+
+def parse_leading_int(value):
+    """Returns the first integer in a value such as "3 Bed", or None."""
+    if isinstance(value, int):
+        return value
+    match = _LEADING_INT_RE.search(value or "")
+    return int(match.group(0)) if match else None
+
+def _text_to_analyze(property_data):
+    """Lowercased description and title, joined once per listing."""
+    return (property_data.get("description", "") + " " + property_data.get("title", "")).lower()
+
+def _apply_analysis_tags(property_data, text_to_analyze, user_matcher=None):
+    """Sets analysis_tags and matched_keywords on property_data from a single pass over its text."""
+    with timed("analyze"):
+        return _apply_analysis_tags_untimed(property_data, text_to_analyze, user_matcher)
+
+def _apply_analysis_tags_untimed(property_data, text_to_analyze, user_matcher):
+    tags, matched_keywords = ANALYSIS_MATCHER.match(text_to_analyze)
+    # Also check property type if available from scrape (e.g. if type is 'Site')
+    if "site" in property_data.get("property_type", "").lower() and "Tag: Development Land" not in tags:
+        hit_tags = set(tags)
+        hit_tags.add("Tag: Development Land")
+        tags = [tag for tag in ANALYSIS_MATCHER.tags if tag in hit_tags] # Keep the declared tag order
+
+    # A price drop seen between crawls, independent of what the description says
+    price_change = property_data.get("price_change")
+    if price_change and price_change.get("delta", 0) < 0:
+        tags.append("Tag: Price Reduced")
+
+    if not tags:
+        tags.append("Tag: Standard Listing")
+
+    if user_matcher is not None:
+        user_tags, user_keywords = user_matcher.match(text_to_analyze)
+        if user_tags:
+            tags.extend(tag for tag in user_tags if tag not in tags)
+            matched_keywords = sorted(set(matched_keywords).union(user_keywords))
+            # Remove "Tag: Standard Listing" if a more specific user tag is added
+            if "Tag: Standard Listing" in tags and len(tags) > 1:
+                tags.remove("Tag: Standard Listing")
+
+    property_data["analysis_tags"] = tags
+    property_data["matched_keywords"] = matched_keywords
+    return property_data
+
 def analyze_property_description(property_data):
     """Analyzes property title and description for keywords and adds tags."""
     if not property_data or not isinstance(property_data, dict):
         return property_data
 
-    description = property_data.get("description", "").lower()
-    title = property_data.get("title", "").lower()
-    text_to_analyze = description + " " + title
-    
-    property_data["analysis_tags"] = []
-
-    for keyword in FIXER_UPPER_KEYWORDS:
-        if re.search(r'\b' + re.escape(keyword) + r'\b', text_to_analyze):
-            if "Tag: Fixer-Upper" not in property_data["analysis_tags"]:
-                property_data["analysis_tags"].append("Tag: Fixer-Upper")
-            # No need to break, a property might have multiple relevant keywords for the same tag
-
-    for keyword in LAND_DEVELOPMENT_KEYWORDS:
-        if re.search(r'\b' + re.escape(keyword) + r'\b', text_to_analyze):
-            if "Tag: Development Land" not in property_data["analysis_tags"]:
-                property_data["analysis_tags"].append("Tag: Development Land")
-    # Also check property type if available from scrape (e.g. if type is 'Site')
-    if "site" in property_data.get("property_type", "").lower() and "Tag: Development Land" not in property_data["analysis_tags"]:
-         property_data["analysis_tags"].append("Tag: Development Land")
-
-    for keyword in QUICK_SALE_KEYWORDS:
-        if re.search(r'\b' + re.escape(keyword) + r'\b', text_to_analyze):
-            if "Tag: Potential Quick Sale" not in property_data["analysis_tags"]:
-                property_data["analysis_tags"].append("Tag: Potential Quick Sale")
-    
-    if not property_data["analysis_tags"]:
-        property_data["analysis_tags"].append("Tag: Standard Listing")
-        
-    return property_data
+    return _apply_analysis_tags(property_data, _text_to_analyze(property_data))
 
 def analyze_listings(properties_list, user_keywords_str):
     """
     Analyzes a list of fetched property data.
-    Applies predefined analysis tags using analyze_property_description.
-    Applies user-defined keyword matching.
+    Applies predefined analysis tags and user-defined keyword matching
+    in one pass over each listing's text.
     """
     if not properties_list:
         return []
 
+    # Compiled once per distinct keyword string and kept in an LRU cache
+    user_matcher = get_user_keyword_matcher(user_keywords_str)
+
     analyzed_properties = []
-    
-    custom_keywords_list = []
-    if user_keywords_str and isinstance(user_keywords_str, str):
-        custom_keywords_list = [kw.strip().lower() for kw in user_keywords_str.split(',') if kw.strip()]
-
-    for prop_data in properties_list:
-        # Apply standard analysis (this function modifies prop_data by adding 'analysis_tags')
-        analyzed_prop = analyze_property_description(prop_data.copy()) # Use .copy()
-
-        # Apply user-defined keywords
-        if custom_keywords_list:
-            text_to_search = (analyzed_prop.get("title", "").lower() + " " + 
-                              analyzed_prop.get("description", "").lower())
-            
-            user_match_found = False
-            for user_kw in custom_keywords_list:
-                if re.search(r'\b' + re.escape(user_kw) + r'\b', text_to_search): # Use regex word boundaries
-                    user_match_found = True
-                    break 
-            
-            if user_match_found:
-                if "Tag: User Keyword Match" not in analyzed_prop["analysis_tags"]:
-                    analyzed_prop["analysis_tags"].append("Tag: User Keyword Match")
-                # Remove "Tag: Standard Listing" if a more specific user tag is added
-                if "Tag: Standard Listing" in analyzed_prop["analysis_tags"] and len(analyzed_prop["analysis_tags"]) > 1:
-                    try:
-                        analyzed_prop["analysis_tags"].remove("Tag: Standard Listing")
-                    except ValueError:
-                        pass # Should be fine
-
-        analyzed_properties.append(analyzed_prop)
+    with timed("analyze"): # One timing for the batch; per-listing timers would cost more than the tagging
+        for prop_data in properties_list:
+            analyzed_prop = prop_data.copy() # Leave the caller's dicts untouched
+            _apply_analysis_tags_untimed(analyzed_prop, _text_to_analyze(analyzed_prop), user_matcher)
+            analyzed_properties.append(analyzed_prop)
         
     return analyzed_properties
 
-def construct_search_url(filters):
-    """Constructs a Daft.ie search URL based on the provided filters."""
-    location = filters.get("location", "ireland")
-    keywords = filters.get("keywords", "")
+def construct_search_url(filters, offset=0, page_size=None):
+    """
+    Constructs a Daft.ie search URL based on the provided filters. offset and page_size
+    select a results page (Daft's from= and pageSize= parameters); the defaults give page 1.
+    """
+    location = (filters.get("location") or "").strip() or "ireland" # The form sends None or "" for "Any"
+    keywords = (filters.get("keywords") or "").strip()
     # property_type_filter = filters.get("propertyType", "") # e.g. "houses", "apartments", "sites"
-    min_price = filters.get("minPrice", "")
-    max_price = filters.get("maxPrice", "")
+    min_price = str(filters.get("minPrice") or "").strip()
+    max_price = str(filters.get("maxPrice") or "").strip()
     # min_beds = filters.get("minBeds", "")
     # max_beds = filters.get("maxBeds", "")
 
@@ -151,157 +191,695 @@ def construct_search_url(filters):
         query_params.append(f"salePrice_to={max_price}")
     # Add other filters like propertyType, numBeds_from, numBeds_to as per Daft's structure
     # e.g., if property_type_filter: query_params.append(f"propertyType={property_type_filter}")
+    if offset:
+        query_params.append(f"from={offset}")
+    if page_size:
+        query_params.append(f"pageSize={page_size}")
     
     if query_params:
         url_parts.append("?" + "&".join(query_params))
         
     return "".join(url_parts)
 
-def scrape_property_details(property_url):
-    """Scrapes detailed information from a single property page."""
-    print(f"Scraping details from: {property_url}")
-    time.sleep(1) 
-    try:
-        response = requests.get(property_url, headers=HEADERS, timeout=20)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        details = {
-            "url": property_url,
-            "title": "",
-            "price": "",
-            "description": "",
-            "ber": "",
-            "features": [],
-            "property_type": "",
-            "date_listed": "", 
-            "analysis_tags": [] 
-        }
-
-        # Selectors need to be verified and updated by inspecting Daft.ie's live HTML.
-        # These are common patterns but are likely to change.
-        title_tag = soup.find('h1', {'data-testid': 'title-block'}) 
+def needs_description(filters, user_keywords_str=None):
+    """
+    Whether a search fetches each listing's detail page for its full description:
+    filters["fetch_details"] if set, else DAFT_FETCH_DETAILS or whether user keywords were
+    given. Without it, listings are tagged from the search page snippet only.
+    """
+    if filters.get("fetch_details") is not None:
+        return bool(filters["fetch_details"])
+    return FETCH_DETAILS or bool(normalize_keywords(user_keywords_str))
+
+# Filters that change how a search is crawled but not its results
+_CRAWL_OPTIONS = ("incremental",)
+
+def canonical_search_key(filters, user_keywords_str=""):
+    """
+    Returns a string identifying a search: the Daft URL built from the filters, the page
+    cap with its default resolved, the remaining filters as trimmed lowercase strings with
+    blank values dropped, and the normalized user keywords. Searches that would produce the
+    same results produce the same key (e.g. minPrice 200000 and "200000").
+    """
+    canonical = {
+        "url": construct_search_url(filters),
+        "keywords": list(normalize_keywords(user_keywords_str)),
+        "max_pages": str(_max_pages(filters.get("max_pages")) or "all"),
+    }
+    for name, value in filters.items():
+        if name in _CRAWL_OPTIONS or name == "max_pages":
+            continue
+        value = "" if value is None else str(value).strip().lower()
+        if value:
+            canonical[name] = value
+    return json.dumps(canonical, sort_keys=True)
+
+def _scrape_property_details(property_url):
+    """Fetches and parses a single property page. Raises on any failure."""
+    from src.lib.http_client import get_default_client
+    from src.lib.page_cache import page_hash
+
+    logger.debug("Scraping details from: %s", property_url)
+    # Pooled keep-alive client; it retries transient errors and applies the per-host rate limit
+    client = get_default_client()
+    response = client.get(property_url)
+    response.raise_for_status()
+
+    # An unchanged page (same bytes) can reuse its parsed fields and skip BeautifulSoup
+    content_hash = None
+    if client.cache is not None and client.cache.cache_parsed:
+        content_hash = page_hash(response.content)
+        cached_details = client.cache.get_parsed(content_hash)
+        if cached_details is not None:
+            cached_details["url"] = property_url
+            return analyze_property_description(cached_details)
+
+    # Parsing and tagging are CPU-bound; with DAFT_PARSE_WORKERS set they run in a worker
+    # process and only the compact details dict comes back
+    details, stage_seconds = run_parse(_parse_detail_page_job, response.content, property_url)
+    _record_stages(stage_seconds)
+    logger.debug("Successfully scraped: %s...", details['title'][:50])
+    if content_hash is not None:
+        client.cache.put_parsed(content_hash, details)
+    return details
+
+def _record_stages(stage_seconds):
+    for stage, seconds in stage_seconds.items():
+        record_stage(stage, seconds)
+
+def _soup(content, parse_only=None):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, HTML_PARSER, parse_only=parse_only)
+
+@lru_cache(maxsize=None)
+def _detail_page_strainer():
+    """Builds only the elements the extractor reads (and their children) instead of the whole page."""
+    from bs4 import SoupStrainer
+    return SoupStrainer(attrs={"data-testid": [
+        "title-block", "price", "description", "ber-rating", "property-type", "features"]})
+
+def _parse_property_page(content, property_url):
+    """Returns (details, {stage: seconds}) without touching metrics, so it can run in a worker process."""
+    start = time.perf_counter()
+    soup = _soup(content, _detail_page_strainer())
+    parse_seconds = time.perf_counter() - start
+    extract_start = time.perf_counter()
+    details = _extract_property_details(soup, property_url)
+    if not details["title"] or not details["price"] or (not details["ber"] and _has_ber_section(content)):
+        # The page doesn't use the data-testid markup; the fallbacks need the whole tree
+        start = time.perf_counter()
+        soup = _soup(content)
+        parse_seconds += time.perf_counter() - start
+        extract_start = time.perf_counter()
+        details = _extract_property_details(soup, property_url)
+    return details, {"parse": parse_seconds, "extract": time.perf_counter() - extract_start}
+
+def _has_ber_section(content):
+    marker = "BER Details"
+    return marker.encode() in content if isinstance(content, bytes) else marker in content
+
+def _parse_detail_page_job(content, property_url):
+    """Parses, extracts and tags one detail page: the unit of work sent to the parse pool."""
+    details, stage_seconds = _parse_property_page(content, property_url)
+    start = time.perf_counter()
+    _apply_analysis_tags_untimed(details, _text_to_analyze(details), None)
+    stage_seconds["analyze"] = time.perf_counter() - start
+    return details, stage_seconds
+
+def parse_property_page(content, property_url):
+    """Parses a property detail page (HTML bytes or text) into a details dict, without analysis tags."""
+    details, stage_seconds = _parse_property_page(content, property_url)
+    _record_stages(stage_seconds)
+    return details
+
+def _extract_property_details(soup, property_url):
+    details = {
+        "url": property_url,
+        "title": "",
+        "price": "",
+        "description": "",
+        "ber": "",
+        "features": [],
+        "property_type": "",
+        "date_listed": "", 
+        "analysis_tags": [] 
+    }
+
+    # Selectors need to be verified and updated by inspecting Daft.ie's live HTML.
+    # These are common patterns but are likely to change.
+    title_tag = soup.find('h1', {'data-testid': 'title-block'}) 
+    if title_tag: details["title"] = title_tag.get_text(strip=True)
+    else: # Fallback
+        title_tag = soup.find('h1')
         if title_tag: details["title"] = title_tag.get_text(strip=True)
-        else: # Fallback
-            title_tag = soup.find('h1')
-            if title_tag: details["title"] = title_tag.get_text(strip=True)
 
-        price_tag = soup.find('strong', {'data-testid': 'price'}) 
+    price_tag = soup.find('strong', {'data-testid': 'price'}) 
+    if price_tag: details["price"] = price_tag.get_text(strip=True)
+    else: # Fallback
+        price_tag = soup.find('span', class_=re.compile(r'price', re.I))
         if price_tag: details["price"] = price_tag.get_text(strip=True)
-        else: # Fallback
-            price_tag = soup.find('span', class_=re.compile(r'price', re.I))
-            if price_tag: details["price"] = price_tag.get_text(strip=True)
 
-        description_tag = soup.find('div', {'data-testid': 'description'}) 
-        if description_tag: details["description"] = description_tag.get_text(separator='\n', strip=True)
-        
-        ber_tag = soup.find('span', {'data-testid': 'ber-rating'}) 
-        if ber_tag: details["ber"] = ber_tag.get_text(strip=True)
-        else: # Fallback for BER, often near 'Energy Rating'
-            ber_parent = soup.find(string=re.compile(r'BER Details', re.I))
-            if ber_parent:
-                ber_info = ber_parent.find_next_sibling()
-                if ber_info : details["ber"] = ber_info.get_text(strip=True).split("\n")[0]
-        
-        # Property Type (often near title or in a summary section)
-        ptype_tag = soup.find('p', {'data-testid': 'property-type'})
-        if ptype_tag: details["property_type"] = ptype_tag.get_text(strip=True)
-
-        # Features (often in a <ul> or specific divs)
-        features_section = soup.find('div', {'data-testid': 'features'}) 
-        if features_section:
-            features_list = features_section.find_all('li') # Or 'p' or 'span' depending on structure
-            if features_list:
-                details["features"] = [f.get_text(strip=True) for f in features_list if f.get_text(strip=True)]
-        
-        print(f"Successfully scraped: {details['title'][:50]}...")
-        # Analyze the scraped data before returning
-        details = analyze_property_description(details)
-        return details
+    description_tag = soup.find('div', {'data-testid': 'description'}) 
+    if description_tag: details["description"] = description_tag.get_text(separator='\n', strip=True)
+    
+    ber_tag = soup.find('span', {'data-testid': 'ber-rating'}) 
+    if ber_tag: details["ber"] = ber_tag.get_text(strip=True)
+    else: # Fallback for BER, often near 'Energy Rating'
+        ber_parent = soup.find(string=re.compile(r'BER Details', re.I))
+        if ber_parent:
+            ber_info = ber_parent.find_next_sibling()
+            if ber_info : details["ber"] = ber_info.get_text(strip=True).split("\n")[0]
+    
+    # Property Type (often near title or in a summary section)
+    ptype_tag = soup.find('p', {'data-testid': 'property-type'})
+    if ptype_tag: details["property_type"] = ptype_tag.get_text(strip=True)
+
+    # Features (often in a <ul> or specific divs)
+    features_section = soup.find('div', {'data-testid': 'features'}) 
+    if features_section:
+        features_list = features_section.find_all('li') # Or 'p' or 'span' depending on structure
+        if features_list:
+            details["features"] = [f.get_text(strip=True) for f in features_list if f.get_text(strip=True)]
+    return details
+
+def scrape_property_details(property_url):
+    """Scrapes detailed information from a single property page."""
+    import requests
+
+    try:
+        return _scrape_property_details(property_url)
     except requests.exceptions.RequestException as e:
-        print(f"Error scraping {property_url}: {e}")
+        logger.warning("Error scraping %s: %s", property_url, e)
         return None
     except Exception as e:
-        print(f"An unexpected error occurred while scraping {property_url}: {e}")
+        logger.exception("An unexpected error occurred while scraping %s: %s", property_url, e)
         return None
 
-def fetch_daft_listings(filters):
-    """Searches Daft.ie based on filters and scrapes results."""
-    search_url = construct_search_url(filters)
-    print(f"Constructed search URL: {search_url}")
-    
-    properties = []
-    page_num = 1
-    # Max pages should ideally be configurable or removed for full search
-    max_pages_to_scrape = filters.get("max_pages", 1) # Default to 1 page for testing, can be overridden
+def _absolute_daft_url(href):
+    """Turns a Daft link into an absolute URL, or None if the format isn't recognized."""
+    if not href:
+        return None
+    if href.startswith('/'):
+        return DAFT_BASE_URL + href
+    if href.startswith('http'):
+        return href
+    return None
 
-    current_url = search_url 
+_NEXT_DATA_RE = re.compile(rb'<script\b[^>]*\bid=["\']?__NEXT_DATA__["\']?[^>]*>(.*?)</script>', re.S | re.I)
 
-    while page_num <= max_pages_to_scrape:
-        print(f"Scraping search results page: {page_num} from {current_url}")
-        time.sleep(2) 
-        try:
-            response = requests.get(current_url, headers=HEADERS, timeout=30)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # Selector for property cards on search results page (NEEDS VERIFICATION)
-            # Daft.ie uses `data-testid` attributes extensively.
-            listing_cards = soup.find_all('li', {'data-testid': re.compile(r'search-result-card_')})
-            if not listing_cards: # Fallback to a more generic structure if the above fails
-                listing_cards = soup.find_all('div', class_=re.compile(r'Card__Content'))
-            
-            if not listing_cards:
-                print("No listing cards found on page. Scraper might need updating or page structure changed.")
-                break
+def _load_next_data(page):
+    """
+    Returns the parsed __NEXT_DATA__ JSON payload embedded in a Daft page (raw HTML or a
+    soup), or None. Raw HTML is searched directly, without building a tree.
+    """
+    if isinstance(page, (bytes, str)):
+        match = _NEXT_DATA_RE.search(page.encode("utf-8") if isinstance(page, str) else page)
+        payload = match.group(1) if match else None
+    else:
+        script_tag = page.find('script', id='__NEXT_DATA__')
+        payload = script_tag.string if script_tag else None
+    if not payload:
+        return None
+    try:
+        return json.loads(payload)
+    except ValueError:
+        logger.warning("Found __NEXT_DATA__ but could not decode it as JSON.")
+        return None
+
+def _details_from_search_listing(listing):
+    """Builds a details dict from one listing of the search page JSON payload."""
+    url = _absolute_daft_url(listing.get("seoFriendlyPath") or listing.get("url"))
+    if not url:
+        return None
+
+    ber = listing.get("ber") or {}
+    seller = listing.get("seller") or {}
+    floor_area = listing.get("floorArea") or {}
+    date_listed = ""
+    if listing.get("publishDate"): # Milliseconds since the epoch
+        date_listed = time.strftime("%Y-%m-%d", time.gmtime(listing["publishDate"] / 1000))
+
+    return {
+        "url": url,
+        "listing_id": str(listing.get("id", "")),
+        "title": listing.get("title", ""),
+        "price": listing.get("price", ""),
+        # Search results only carry a short snippet; the full text is on the detail page
+        "description": listing.get("description") or listing.get("snippet") or "",
+        "description_complete": False,
+        "ber": ber.get("rating", "") if isinstance(ber, dict) else str(ber),
+        "features": [],
+        "property_type": listing.get("propertyType", ""),
+        "beds": listing.get("numBedrooms", ""),
+        "baths": listing.get("numBathrooms", ""),
+        "floor_area": f"{floor_area.get('value')} m²" if isinstance(floor_area, dict) and floor_area.get("value") else "",
+        "seller": seller.get("name", "") if isinstance(seller, dict) else "",
+        "date_listed": date_listed,
+        "analysis_tags": []
+    }
+
+def extract_search_page_listings(page):
+    """
+    Builds details dicts for every listing on a search results page (raw HTML or a soup)
+    from its embedded __NEXT_DATA__ payload. Returns None when the page has no usable payload.
+    """
+    return _listings_from_next_data(_load_next_data(page))
+
+def _listings_from_next_data(next_data):
+    if not next_data:
+        return None
+    page_props = next_data.get("props", {}).get("pageProps", {})
+    raw_listings = page_props.get("listings")
+    if not raw_listings:
+        return None
+
+    listings = []
+    for item in raw_listings:
+        listing = item.get("listing", item) if isinstance(item, dict) else None # Entries wrap the listing
+        details = _details_from_search_listing(listing) if isinstance(listing, dict) else None
+        if details:
+            listings.append(details)
+    return listings or None
+
+def _paging_from_next_data(next_data):
+    """Returns {"total_results", "page_size"} from a search page payload, or None if it doesn't say."""
+    paging = next_data.get("props", {}).get("pageProps", {}).get("paging") if next_data else None
+    if not isinstance(paging, dict):
+        return None
+    total_results, page_size = paging.get("totalResults"), paging.get("pageSize")
+    if not isinstance(total_results, int) or not isinstance(page_size, int) or page_size <= 0:
+        return None
+    return {"total_results": total_results, "page_size": page_size}
+
+@lru_cache(maxsize=None)
+def _next_button_strainer():
+    """The pagination links are all a page with a JSON payload still needs from the tree."""
+    from bs4 import SoupStrainer
+    return SoupStrainer("a", attrs={"data-testid": "next-button"})
+
+_NEXT_CLASS_RE = re.compile(rb'class=["\'][^"\']*\bnext\b', re.I)
+
+def _parse_search_page_job(content):
+    """
+    Parses a search results page (HTML bytes) into (entries, next page URL, paging, {stage: seconds});
+    the unit of work sent to the parse pool. See _search_page_entries for entries and
+    _paging_from_next_data for paging.
+    """
+    stage_seconds = {"parse": 0.0, "extract": 0.0}
+    def parse(**kwargs):
+        start = time.perf_counter()
+        soup = _soup(content, **kwargs)
+        stage_seconds["parse"] += time.perf_counter() - start
+        return soup
+
+    start = time.perf_counter()
+    next_data = _load_next_data(content)
+    json_listings = _listings_from_next_data(next_data)
+    paging = _paging_from_next_data(next_data)
+    stage_seconds["extract"] += time.perf_counter() - start
+    if json_listings:
+        soup = parse(parse_only=_next_button_strainer())
+    else:
+        soup = parse()
+
+    start = time.perf_counter()
+    entries = _search_page_entries(soup, json_listings)
+    next_url = _next_page_url(soup)
+    stage_seconds["extract"] += time.perf_counter() - start
+    if next_url is None and json_listings and _NEXT_CLASS_RE.search(content):
+        # Only the li.next fallback link is left, which the strained tree doesn't have
+        soup = parse()
+        start = time.perf_counter()
+        next_url = _next_page_url(soup)
+        stage_seconds["extract"] += time.perf_counter() - start
+    return entries, next_url, paging, stage_seconds
+
+def _search_page_entries(soup, json_listings=None):
+    """
+    Returns (url, partial_details) for each listing on a search results page.
+    partial_details comes from the JSON payload; it is None when only the HTML cards
+    could be read, in which case the detail page has to be fetched.
+    """
+    if json_listings is None:
+        json_listings = extract_search_page_listings(soup)
+    if json_listings:
+        return [(details["url"], details) for details in json_listings]
+
+    # Selector for property cards on search results page (NEEDS VERIFICATION)
+    # Daft.ie uses `data-testid` attributes extensively.
+    listing_cards = soup.find_all('li', {'data-testid': re.compile(r'search-result-card_')})
+    if not listing_cards: # Fallback to a more generic structure if the above fails
+        listing_cards = soup.find_all('div', class_=re.compile(r'Card__Content'))
+
+    entries = []
+    for card_item in listing_cards:
+        link_tag = card_item.find('a', href=True)
+        property_page_url = _absolute_daft_url(link_tag['href']) if link_tag else None
+        if property_page_url:
+            entries.append((property_page_url, None))
+    return entries
+
+def _next_page_url(soup):
+    """Returns the absolute URL of the next results page, or None at the end of the results."""
+    # Pagination logic (NEEDS VERIFICATION)
+    next_page_tag = soup.find('a', {'data-testid': 'next-button', 'aria-label': 'Next page'})
+    if not next_page_tag: # Fallback
+        next_page_tag = soup.find('li', class_='next')
+        if next_page_tag: next_page_tag = next_page_tag.find('a', href=True)
+
+    if not next_page_tag or not next_page_tag.get('href'):
+        logger.debug("No 'next page' link found or end of results.")
+        return None
+    next_url = _absolute_daft_url(next_page_tag['href'])
+    if not next_url:
+        logger.warning("Next page link found, but format is not absolute or recognized. Stopping pagination.")
+    return next_url
+
+def _price_change(previous, details):
+    """Returns {"previous_price", "price", "delta"} when the parsed price moved, else None."""
+    old_value, new_value = parse_price(previous.get("price")), parse_price(details.get("price"))
+    if old_value is None or new_value is None or old_value == new_value:
+        return None
+    return {"previous_price": previous.get("price", ""), "price": details.get("price", ""), "delta": new_value - old_value}
 
-            print(f"Found {len(listing_cards)} listings on page {page_num}.")
-
-            for card_item in listing_cards: # Renamed to avoid conflict
-                link_tag = card_item.find('a', href=True)
-                property_page_url = None
-                if link_tag and link_tag['href']:
-                    if link_tag['href'].startswith('/'):
-                        property_page_url = DAFT_BASE_URL + link_tag['href']
-                    elif link_tag['href'].startswith('http'):
-                        property_page_url = link_tag['href']
-                
-                if property_page_url:
-                    # Avoid re-scraping if URL already processed (can happen with complex layouts)
-                    if not any(p['url'] == property_page_url for p in properties):
-                        detailed_info = scrape_property_details(property_page_url)
-                        if detailed_info:
-                            properties.append(detailed_info)
-                    else:
-                        print(f"Skipping already processed URL: {property_page_url}")
-            
-            # Pagination logic (NEEDS VERIFICATION)
-            next_page_tag = soup.find('a', {'data-testid': 'next-button', 'aria-label': 'Next page'})
-            if not next_page_tag: # Fallback
-                 next_page_tag = soup.find('li', class_='next')
-                 if next_page_tag: next_page_tag = next_page_tag.find('a', href=True)
-
-            if next_page_tag and next_page_tag.get('href'):
-                next_page_href = next_page_tag['href']
-                if next_page_href.startswith('/'):
-                    current_url = DAFT_BASE_URL + next_page_href
-                elif next_page_href.startswith('http'):
-                    current_url = next_page_href
-                else:
-                    print("Next page link found, but format is not absolute or recognized. Stopping pagination.")
-                    break
-                page_num += 1
+def _card_changed(partial, previous):
+    """
+    Compares what a search card shows (price and listing date) with the card the previous
+    crawl saw. Detail page values overwrite the card's in the merged listing, so the card's
+    own values are kept as "card_price"/"card_date" (see _iter_started_results).
+    """
+    old_price = previous.get("card_price", previous.get("price"))
+    old_date = previous.get("card_date", previous.get("date_listed"))
+    new_value, old_value = parse_price(partial.get("price")), parse_price(old_price)
+    if new_value is None and old_value is None: # e.g. "Price on application"
+        price_changed = (partial.get("price") or "").strip() != (old_price or "").strip()
+    else:
+        price_changed = new_value != old_value
+    return price_changed or (partial.get("date_listed") or "") != (old_date or "")
+
+def _with_stored_description(stored, partial):
+    """Fresh search page values (price, seller...) over a stored detail page."""
+    details = dict(stored)
+    details.update(partial or {})
+    details.update(description=stored.get("description", ""), features=stored.get("features", []),
+                   description_complete=stored.get("description_complete", True))
+    return details
+
+def _start_page_results(entries, executor, need_description, known_details=None, previous=None):
+    """
+    Queues a page's detail fetches on `executor`; _iter_started_results then yields
+    (url, details, error) for its entries in order, details being set alongside an error
+    when only the detail page failed. Detail pages are fetched only for entries without
+    JSON data or, when need_description is set, whose description is just the search
+    snippet. known_details(urls) may return {url: details} for listings whose detail page
+    is already known, which are not fetched again.
+
+    In incremental mode `previous` maps urls to the listings seen by the last crawl: listings
+    whose card is unchanged are reused without a request, new and changed ones are fetched,
+    and every listing gets a "change" of "new", "changed" or "unchanged".
+    """
+    incremental = previous is not None
+    previous = previous or {}
+    reused, candidates = {}, []
+    for url, partial in entries:
+        if url in previous and partial and not _card_changed(partial, previous[url]):
+            reused[url] = _with_stored_description(previous[url], partial)
+        elif incremental or partial is None or not partial.get("title") or need_description:
+            candidates.append(url)
+    # Changed listings are re-fetched rather than filled from the store
+    known = known_details(candidates) if known_details and candidates and not incremental else {}
+    futures = {url: submit_with_context(executor, _scrape_property_details, url) for url in candidates if url not in known}
+    return entries, incremental, previous, reused, known, futures
+
+def _iter_started_results(started):
+    entries, incremental, previous, reused, known, futures = started
+    for url, partial in entries:
+        error = None
+        if url in reused:
+            details = reused[url]
+        elif url in known:
+            details = _with_stored_description(known[url], partial)
+        elif url in futures:
+            try:
+                details = futures[url].result()
+                if partial:
+                    # Detail page values win; JSON-only fields (listing id, beds, seller...) are kept
+                    details = dict(partial, **{key: value for key, value in details.items() if value})
+                    details["description_complete"] = True
+            except Exception as e:
+                logger.warning("Error scraping %s: %s", url, e)
+                details, error = partial, e # Keep the search page data even if the detail page failed
+        else:
+            details = partial
+
+        if details and partial: # What the next incremental crawl compares this card with
+            details["card_price"], details["card_date"] = partial.get("price"), partial.get("date_listed")
+        if incremental and details:
+            details.pop("price_change", None)
+            if url not in previous:
+                details["change"] = "new"
+            elif url in reused:
+                details["change"] = "unchanged"
             else:
-                print("No 'next page' link found or end of results.")
-                break
+                details["change"] = "changed"
+                price_change = _price_change(previous[url], details)
+                if price_change:
+                    details["price_change"] = price_change
+        yield url, details, error
+
+def _max_pages(value):
+    """filters["max_pages"] as a page count, or None for every page ("all", 0 or less)."""
+    if value is None or value == "":
+        value = DEFAULT_MAX_PAGES
+    if isinstance(value, str):
+        if value.strip().lower() == "all":
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            logger.warning("Ignoring invalid max_pages %r; crawling %s page(s).", value, DEFAULT_MAX_PAGES)
+            return _max_pages(DEFAULT_MAX_PAGES)
+    return value if value > 0 else None
+
+def _plan_page_urls(filters, paging, max_pages):
+    """URLs of results pages 2 onwards, from the total page 1 reports and explicit offsets."""
+    page_size = paging["page_size"]
+    total_pages = -(-paging["total_results"] // page_size)
+    if max_pages is not None:
+        total_pages = min(total_pages, max_pages)
+    return [construct_search_url(filters, offset=(page - 1) * page_size, page_size=page_size)
+            for page in range(2, total_pages + 1)]
+
+def _fetch_search_page(url):
+    """Fetches and parses one results page into (entries, next page URL, paging). Raises on any failure."""
+    from src.lib.http_client import DEFAULT_CONNECT_TIMEOUT, get_default_client
+
+    response = get_default_client().get(url, timeout=(DEFAULT_CONNECT_TIMEOUT, 30))
+    response.raise_for_status()
+    entries, next_url, paging, stage_seconds = run_parse(_parse_search_page_job, response.content)
+    _record_stages(stage_seconds)
+    return entries, next_url, paging
+
+def _search_page_error(page_num, error):
+    import requests
+
+    ERRORS.inc(kind="search_page")
+    if isinstance(error, requests.exceptions.RequestException):
+        logger.warning("Error fetching search results page %d: %s", page_num, error)
+    else:
+        logger.error("An unexpected error occurred on search page %d: %s", page_num, error, exc_info=error)
+    return {"type": "error", "page": page_num, "error": str(error)}
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching search results page {page_num}: {e}")
-            break
+def iter_daft_listings(filters, user_keywords_str=None, need_description=None, known_details=None,
+                       previous_listings=None):
+    """
+    Searches Daft.ie based on filters and yields events as the crawl progresses:
+      {"type": "page", "page": n, "max_pages": m, "listings": k}  when a results page is parsed
+      {"type": "property", "property": details}                   for each analyzed listing, in card order
+      {"type": "error", "url" or "page": ..., "error": "..."}      for pages that could not be scraped
+      {"type": "stopped", "page": n}                              when an incremental crawl stops early
+
+    Listings are read from the JSON payload embedded in each results page, so a page costs
+    one request. Detail pages are fetched (concurrently, filters["max_workers"] threads) only
+    when the payload is missing or the full description is needed. need_description defaults
+    to needs_description(filters, user_keywords_str).
+    known_details (see _start_page_results) lets a listing store fill in detail pages it already has.
+    Pages are parsed on the parse pool (DAFT_PARSE_WORKERS processes, see parse_pool) when one is set.
+    Listings are tagged with the predefined tags and, if given, the user keywords.
+
+    filters["max_pages"] caps the results pages crawled (DEFAULT_MAX_PAGES; "all" for every
+    page). When page 1 reports the total result count, the URLs of the other pages are built
+    from offsets and fetched concurrently (SEARCH_PAGE_WORKERS, within the rate limit), and
+    each page's detail fetches are queued on the shared pool as soon as the page arrives;
+    events still come in page order, with "max_pages" set to the number of pages planned.
+    Without a total the crawl follows the next-page links one page at a time.
+
+    Incremental mode (previous_listings given, a callable returning {url: details} from the
+    last crawl): each results page is diffed against the previous snapshot by listing and
+    card price/date, only new or changed listings are fetched, price moves are attached as
+    "price_change", and pagination stops (with a "stopped" event) after a page with nothing
+    new or changed, so the listings of later pages are not yielded. Daft orders results
+    newest first, so that page marks where the previous crawl's data begins, which is why
+    incremental crawls always follow links.
+    """
+    search_url = construct_search_url(filters)
+    logger.debug("Constructed search URL: %s", search_url)
+    
+    user_matcher = get_user_keyword_matcher(user_keywords_str)
+    if need_description is None:
+        need_description = needs_description(filters, user_keywords_str)
+    seen_urls = set()
+    max_pages_to_scrape = _max_pages(filters.get("max_pages"))
+    max_workers = filters.get("max_workers", DETAIL_FETCH_WORKERS)
+
+    def start_page(page_num, page):
+        """Dedupes a fetched page against earlier ones and queues its detail fetches."""
+        entries, next_url, _ = page
+        page_entries = []
+        for url, partial in entries:
+            # Avoid re-scraping if URL already processed (can happen with complex layouts)
+            if url not in seen_urls:
+                seen_urls.add(url)
+                page_entries.append((url, partial))
+            else:
+                logger.debug("Skipping already processed URL: %s", url)
+
+        previous = None
+        if previous_listings is not None:
+            previous = previous_listings([url for url, _ in page_entries])
+        started = _start_page_results(page_entries, executor, need_description, known_details, previous)
+        return {"page": page_num, "listings": len(entries), "entries": page_entries, "previous": previous,
+                "next_url": next_url, "started": started}
+
+    def start_planned_pages(block):
+        """
+        Starts planned pages whose fetch has finished, in page order; with block, waits until
+        one more page is queued (started, or failed with an error event) or none are left.
+        """
+        while planned and (block or planned[0][1].done()):
+            block = False # Every page taken below queues an entry in pages
+            page_num, future = planned.popleft()
+            try:
+                page = future.result()
+            except Exception as e:
+                pages.append({"page": page_num, "error_event": _search_page_error(page_num, e)})
+                continue
+            if not page[0]:
+                logger.warning("No listing cards found on page %d. Skipping it.", page_num)
+                ERRORS.inc(kind="search_page")
+                pages.append({"page": page_num, "error_event": {
+                    "type": "error", "page": page_num, "error": "No listing cards found on the page"}})
+                continue
+            pages.append(start_page(page_num, page))
+
+    # One bounded pool for the whole crawl's detail pages; the shared client's per-host limiter keeps it polite
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    page_executor = None
+    try:
+        logger.debug("Scraping search results page 1 from %s", search_url)
+        try:
+            first_page = _fetch_search_page(search_url)
         except Exception as e:
-            print(f"An unexpected error occurred on search page {page_num}: {e}")
-            break
-            
+            yield _search_page_error(1, e)
+            return
+        if not first_page[0]:
+            logger.warning("No listing cards found on page. Scraper might need updating or page structure changed.")
+            return
+
+        planned = deque() # (page number, future) for pages 2.. fetched from computed offsets
+        paging = first_page[2]
+        if paging and previous_listings is None and max_pages_to_scrape != 1:
+            page_urls = _plan_page_urls(filters, paging, max_pages_to_scrape)
+            if page_urls:
+                logger.debug("Planned %d more results pages from %d results.", len(page_urls), paging["total_results"])
+                page_executor = ThreadPoolExecutor(max_workers=min(SEARCH_PAGE_WORKERS, len(page_urls)))
+                planned.extend((page_num, submit_with_context(page_executor, _fetch_search_page, url))
+                               for page_num, url in enumerate(page_urls, start=2))
+        planned_crawl = bool(planned)
+        page_count = len(planned) + 1 if planned_crawl else max_pages_to_scrape
+
+        pages = deque([start_page(1, first_page)]) # Started pages waiting to be yielded, in order
+        while pages:
+            page = pages.popleft()
+            page_num = page["page"]
+            if "error_event" in page:
+                yield page["error_event"]
+                start_planned_pages(block=not pages)
+                continue
+
+            PAGES.inc()
+            logger.debug("Found %d listings on page %d.", page["listings"], page_num)
+            yield {"type": "page", "page": page_num, "max_pages": page_count, "listings": page["listings"]}
+
+            page_changes = 0
+            for url, detailed_info, error in _iter_started_results(page["started"]):
+                if error is not None or not detailed_info:
+                    ERRORS.inc(kind="detail_page")
+                    yield {"type": "error", "url": url, "error": str(error) if error else "No details returned"}
+                if detailed_info:
+                    if detailed_info.get("change") != "unchanged":
+                        page_changes += 1
+                    _apply_analysis_tags(detailed_info, _text_to_analyze(detailed_info), user_matcher)
+                    LISTINGS.inc()
+                    yield {"type": "property", "property": detailed_info}
+                start_planned_pages(block=False) # Pages that arrived meanwhile join the detail queue early
+
+            if planned_crawl:
+                start_planned_pages(block=not pages)
+                continue
+
+            # Following links: page 1 reported no total, or this is an incremental crawl
+            if page["previous"] is not None and page["entries"] and not page_changes:
+                logger.info("Page %d has only known, unchanged listings. Stopping incremental crawl.", page_num)
+                if page["next_url"] and (max_pages_to_scrape is None or page_num < max_pages_to_scrape):
+                    yield {"type": "stopped", "page": page_num}
+                break
+            current_url = page["next_url"]
+            if not current_url or (max_pages_to_scrape is not None and page_num >= max_pages_to_scrape):
+                break
+            logger.debug("Scraping search results page: %s from %s", page_num + 1, current_url)
+            try:
+                next_page = _fetch_search_page(current_url)
+            except Exception as e:
+                yield _search_page_error(page_num + 1, e)
+                break
+            if not next_page[0]:
+                logger.warning("No listing cards found on page. Scraper might need updating or page structure changed.")
+                break
+            pages.append(start_page(page_num + 1, next_page))
+    finally:
+        # If the consumer stops early (e.g. a streaming client disconnects), drop queued fetches
+        executor.shutdown(wait=False, cancel_futures=True)
+        if page_executor is not None:
+            page_executor.shutdown(wait=False, cancel_futures=True)
+
+def __getattr__(name):
+    # HEADERS used to be defined here; resolving it lazily keeps requests out of the import
+    if name == "HEADERS":
+        from src.lib.http_client import DEFAULT_HEADERS
+        return DEFAULT_HEADERS
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def fetch_daft_listings(filters, errors=None, need_description=None, known_details=None, previous_listings=None,
+                        stopped=None):
+    """
+    Searches Daft.ie based on filters and scrapes results, returned in card order.
+    If an `errors` list is given, a {"url", "error"} dict is appended to it for every
+    detail page that could not be scraped, and a {"page", "error"} dict for every results
+    page that failed (its listings are missing from the result). If a `stopped` list is
+    given, an incremental crawl that stopped before the last results page appends the
+    {"page"} it stopped after. See iter_daft_listings for need_description, known_details
+    and incremental crawls with previous_listings.
+    """
+    properties = []
+    for event in iter_daft_listings(filters, need_description=need_description, known_details=known_details,
+                                    previous_listings=previous_listings):
+        if event["type"] == "property":
+            properties.append(event["property"])
+        elif event["type"] == "error" and errors is not None:
+            errors.append({key: event[key] for key in ("url", "page", "error") if key in event})
+        elif event["type"] == "stopped" and stopped is not None:
+            stopped.append({"page": event["page"]})
     return properties
 
 if __name__ == '__main__':
@@ -0,0 +1,175 @@
+# fulltext.py
+
+import logging
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.lib.listing_store import active_filters, apply_filters
+from src.models.listing import Listing
+from src.models.user import db
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "listing_fts"
+
+# Porter stemming so "gardens" finds "garden"; prefix indexes keep short prefix queries fast
+FTS_TOKENIZE = "porter unicode61 remove_diacritics 2"
+FTS_PREFIX = "2 3"
+
+# bm25() weights for the indexed columns (title, description, features)
+BM25_WEIGHTS = (5.0, 1.0, 2.0)
+
+# Words around the first match in a result's description snippet
+SNIPPET_TOKENS = 16
+
+DEFAULT_SEARCH_LIMIT = 20
+
+_FEATURES_SQL = "(SELECT group_concat(value, ' ') FROM json_each({row}.details_json, '$.features'))"
+
+# The index follows the listing table through triggers, so every write path (bulk upserts
+# included) updates it in the same transaction. Its rowids are the listing table's rowids.
+_CREATE_STATEMENTS = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, description, features, tokenize='{FTS_TOKENIZE}', prefix='{FTS_PREFIX}')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON listing BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description, features) "
+    f"VALUES (new.rowid, new.title, new.description, {_FEATURES_SQL.format(row='new')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description, details_json ON listing "
+    f"WHEN old.title IS NOT new.title OR old.description IS NOT new.description "
+    f"OR old.details_json IS NOT new.details_json BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid; "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description, features) "
+    f"VALUES (new.rowid, new.title, new.description, {_FEATURES_SQL.format(row='new')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON listing BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid; END",
+)
+
+_REBUILD_STATEMENTS = (
+    f"DELETE FROM {FTS_TABLE}",
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description, features) "
+    f"SELECT rowid, title, description, {_FEATURES_SQL.format(row='listing')} FROM listing",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')",
+)
+
+
+def ensure_fulltext_index():
+    """
+    Creates the FTS5 index over stored listings' title, description and features, and
+    fills it from the listings already stored the first time. Returns False when the
+    database isn't SQLite or its SQLite has no FTS5; full-text search is then off.
+    """
+    if db.engine.dialect.name != "sqlite":
+        logger.info("Full-text search needs SQLite FTS5; %s database in use.", db.engine.dialect.name)
+        return False
+    try:
+        with db.engine.begin() as connection:
+            exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                        {"name": FTS_TABLE}).first()
+            for statement in _CREATE_STATEMENTS:
+                connection.execute(text(statement))
+            if not exists:
+                for statement in _REBUILD_STATEMENTS:
+                    connection.execute(text(statement))
+            # The rank column (and its ORDER BY rank LIMIT shortcut) uses these weights
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', :rank)"),
+                               {"rank": f"bm25({', '.join(str(weight) for weight in BM25_WEIGHTS)})"})
+    except OperationalError as e: # e.g. "no such module: fts5"
+        logger.warning("Full-text search unavailable: %s", e)
+        return False
+    return True
+
+
+def rebuild_fulltext_index():
+    """Re-indexes every stored listing, e.g. after a VACUUM has renumbered the listing table's rowids."""
+    with db.engine.begin() as connection:
+        for statement in _REBUILD_STATEMENTS:
+            connection.execute(text(statement))
+
+
+def _fts_string(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+_TOKEN_RE = re.compile(r'"([^"]*)"?|(,)|([^\s",]+)')
+
+
+def match_expression(query):
+    """
+    Turns a search box query into an FTS5 MATCH expression:
+      garden shed        listings with both words
+      "sea view"         the exact phrase
+      renov*             any word starting with "renov"
+      sea view, garden   comma separated alternatives, as in the keywords field
+    Every term is quoted, so FTS5 syntax in the query is searched for literally.
+    Raises ValueError if there is nothing to search for.
+    """
+    groups, terms = [], []
+    for phrase, comma, word in _TOKEN_RE.findall(query or ""):
+        if comma:
+            groups.append(terms)
+            terms = []
+        elif word:
+            prefix = word.endswith("*")
+            word = word.rstrip("*")
+            if re.search(r"\w", word):
+                terms.append(_fts_string(word) + ("*" if prefix else ""))
+        elif re.search(r"\w", phrase):
+            terms.append(_fts_string(phrase.strip()))
+    groups.append(terms)
+    groups = [group for group in groups if group]
+    if not groups:
+        raise ValueError("query has no words to search for")
+    return " OR ".join("(" + " AND ".join(group) + ")" for group in groups)
+
+
+_fts = db.table(FTS_TABLE, db.column("rowid"), db.column("rank"))
+_listing_rowid = db.literal_column("listing.rowid")
+
+
+def _snippets(match, rowids):
+    """{rowid: description snippet} for the listings on a result page."""
+    if not rowids:
+        return {}
+    snippet = db.literal_column(f"snippet({FTS_TABLE}, 1, '[', ']', '…', {SNIPPET_TOKENS})")
+    statement = db.select(_fts.c.rowid, snippet).where(match, _fts.c.rowid.in_(rowids))
+    return dict(db.session.execute(statement).all())
+
+
+def search_listings(query, filters=None, limit=DEFAULT_SEARCH_LIMIT, offset=0, max_age=None):
+    """
+    Ranks stored listings against a full-text query (see match_expression) with BM25,
+    optionally narrowed by a filters dict and a maximum age in seconds.
+    Returns (results, total): the details of results[offset:offset + limit], most relevant
+    first, each with "relevance" (higher is better) and a "snippet" of the description
+    with the matched words in [brackets]; and the number of matching listings.
+    Raises ValueError for a query without words.
+    """
+    match = text(f"{FTS_TABLE} MATCH :expression").bindparams(expression=match_expression(query))
+    matched = db.select(_fts.c.rowid, _fts.c.rank).where(match)
+    filters = active_filters(filters or {}) # e.g. a request's unset filters all come in as None
+    if filters or max_age: # The filters are listing columns, so rank after joining
+        ranked = matched.subquery()
+        query = apply_filters(Listing.query.join(ranked, ranked.c.rowid == _listing_rowid), filters)
+        if max_age:
+            query = query.filter(Listing.scraped_at >= datetime.utcnow() - timedelta(seconds=max_age))
+        total = query.with_entities(db.func.count()).scalar()
+        rows = query.add_columns(ranked.c.rowid, ranked.c.rank) \
+            .order_by(ranked.c.rank, Listing.listing_id).limit(limit).offset(offset).all()
+    else: # FTS5 ranks and cuts the page itself, so only that page is joined
+        total = db.session.execute(db.select(db.func.count()).select_from(_fts).where(match)).scalar()
+        page = matched.order_by(_fts.c.rank).limit(limit).offset(offset).subquery()
+        rows = Listing.query.join(page, page.c.rowid == _listing_rowid) \
+            .add_columns(page.c.rowid, page.c.rank).order_by(page.c.rank, Listing.listing_id).all()
+
+    snippets = _snippets(match, [rowid for _, rowid, _ in rows])
+    results = []
+    for listing, rowid, score in rows:
+        details = listing.to_dict()
+        details["listing_id"] = listing.listing_id
+        details["relevance"] = round(-score, 4) # bm25() is lower for better matches
+        details["snippet"] = snippets.get(rowid, "")
+        results.append(details)
+    return results, total
@@ -0,0 +1,225 @@
+# http_client.py
+
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.lib.metrics import HTTP_REQUESTS, HTTP_RETRIES, record_stage, timed
+from src.lib.page_cache import DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS, PageCache
+from src.lib.rate_limiter import get_host_limiter
+
+try: # urllib3 decodes brotli transparently when one of these is installed
+    import brotli # noqa: F401
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi # noqa: F401
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+# Connection pool and timeout defaults
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 20
+
+# Retry defaults: exponential backoff with full jitter, capped
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    # Only advertise br when we can actually decode it
+    'Accept-Encoding': 'gzip, deflate, br' if BROTLI_AVAILABLE else 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9'
+}
+
+
+def parse_retry_after(value):
+    """Returns the number of seconds a Retry-After header asks for, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class DaftHttpClient:
+    """
+    Pooled, keep-alive HTTP client shared by every Daft request.
+    Retries connection errors and 429/5xx responses with exponential backoff and
+    jitter (honouring Retry-After), goes through the per-host rate limiter on every
+    attempt, and keeps counters readable through stats().
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX,
+                 headers=None, rate_limit=True, cache=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache # Optional PageCache consulted before the network
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limit = rate_limit
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        # Retries are handled here, not by urllib3, so they can be counted and rate limited
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "errors": 0, "bytes_received": 0, "bytes_decoded": 0}
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def get(self, url, timeout=None, **kwargs):
+        """
+        GETs url, retrying transient failures. Returns the final response (which may
+        still carry an error status); raises the last RequestException if every
+        attempt failed to connect.
+
+        With a page cache configured, fresh entries are served without touching the
+        network (or the rate limiter) and stale ones are revalidated with a conditional GET.
+        Time spent here is recorded as the "fetch" stage.
+        """
+        with timed("fetch"):
+            return self._get(url, timeout, **kwargs)
+
+    def _get(self, url, timeout=None, **kwargs):
+        if self.cache is None or kwargs:
+            return self._get_with_retries(url, timeout, **kwargs)
+
+        cached = self.cache.lookup(url)
+        if cached is not None:
+            meta, body, is_fresh = cached
+            if is_fresh:
+                return self.cache.build_response(url, meta, body)
+            response = self._get_with_retries(url, timeout, headers=self.cache.conditional_headers(meta))
+            if response.status_code == 304:
+                self.cache.mark_revalidated(url, meta, body)
+                return self.cache.build_response(url, meta, body)
+        else:
+            response = self._get_with_retries(url, timeout)
+
+        if response.status_code == 200:
+            self.cache.store(url, response)
+        return response
+
+    def _get_with_retries(self, url, timeout=None, **kwargs):
+        attempt = 0
+        while True:
+            if self.rate_limit:
+                record_stage("rate_limit_wait", get_host_limiter(url).acquire())
+            try:
+                response = self.session.get(url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._count(requests=1, errors=1)
+                HTTP_REQUESTS.inc(status="error")
+                if attempt >= self.max_retries:
+                    raise
+                self._count(retries=1)
+                HTTP_RETRIES.inc()
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            content = response.content # Read the body so the connection goes back to the pool
+            wire_bytes = response.raw.tell() if response.raw is not None else len(content)
+            self._count(requests=1, bytes_received=wire_bytes or len(content), bytes_decoded=len(content))
+            HTTP_REQUESTS.inc(status=response.status_code)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                self._count(retries=1)
+                HTTP_RETRIES.inc()
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                time.sleep(self._backoff(attempt, retry_after))
+                attempt += 1
+                continue
+            return response
+
+    def stats(self):
+        """Returns a snapshot of the client's counters, including connection reuse."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        connections_opened = 0
+        pooled_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None: # Evicted since keys() was read
+                continue
+            connections_opened += pool.num_connections
+            pooled_requests += pool.num_requests
+        snapshot["connections_opened"] = connections_opened
+        snapshot["connections_reused"] = max(0, pooled_requests - connections_opened)
+        if self.cache is not None:
+            snapshot["cache"] = self.cache.stats()
+        return snapshot
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def _page_cache_from_env():
+    """Builds a PageCache when DAFT_PAGE_CACHE_DIR is set, otherwise returns None."""
+    directory = os.getenv("DAFT_PAGE_CACHE_DIR")
+    if not directory:
+        return None
+    return PageCache(
+        directory,
+        ttl=float(os.getenv("DAFT_PAGE_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+        max_bytes=int(os.getenv("DAFT_PAGE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        cache_parsed=os.getenv("DAFT_PAGE_CACHE_PARSED", "") == "1",
+    )
+
+
+def get_default_client():
+    """Returns the process-wide client, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = DaftHttpClient(cache=_page_cache_from_env())
+        return _default_client
+
+
+def configure_http_client(**options):
+    """Replaces the process-wide client with one built from `options` (see DaftHttpClient)."""
+    global _default_client
+    client = DaftHttpClient(**options)
+    with _default_client_lock:
+        previous, _default_client = _default_client, client
+    if previous is not None:
+        previous.close()
+    return client
@@ -0,0 +1,110 @@
+# job_queue.py
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the local analysis job pool
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_RESULT_TTL_SECONDS = 15 * 60
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class Job:
+    """One submitted analysis. `result` is whatever the runner returned."""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = JOB_QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.subscribers = 1 # Submissions coalesced onto this job, including the first
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "subscribers": self.subscribers,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded local thread pool.
+
+    Submissions with the same key while a job for that key is queued or running
+    are coalesced onto it (singleflight), so identical searches are crawled once.
+    Finished jobs stay retrievable by id for `result_ttl` seconds.
+    """
+
+    def __init__(self, runner, max_workers=DEFAULT_JOB_WORKERS, result_ttl=DEFAULT_RESULT_TTL_SECONDS):
+        self.runner = runner
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="analysis-job")
+        self._lock = threading.Lock()
+        self._jobs = {} # job id -> Job
+        self._in_flight = {} # key -> Job still queued or running
+
+    def submit(self, key, *args, **kwargs):
+        """
+        Returns (job, coalesced). `coalesced` is True when an identical job was
+        already in flight and no new work was queued.
+        """
+        with self._lock:
+            self._purge_locked()
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.subscribers += 1
+                return job, True
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+        self._executor.submit(self._run, job, args, kwargs)
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_locked()
+            return self._jobs.get(job_id)
+
+    def _run(self, job, args, kwargs):
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = self.runner(*args, **kwargs)
+            job.status = JOB_DONE
+        except Exception as e:
+            logger.exception("Job %s failed: %s", job.id, e)
+            job.error = str(e)
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+
+    def _purge_locked(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
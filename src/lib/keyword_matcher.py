@@ -0,0 +1,190 @@
+# keyword_matcher.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# How many distinct user keyword strings keep a compiled matcher around
+USER_MATCHER_CACHE_SIZE = 256
+
+# Prebuilt matchers for the fixed keyword lists, written by `python -m src.lib.keyword_matcher`
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "keyword_matchers.json")
+
+
+class KeywordMatcher:
+    """
+    Matches many tagged keywords against a text in a single regex pass.
+
+    All keywords are compiled into one alternation (longest first) wrapped in a
+    lookahead, so matches at every word boundary are reported, including ones
+    that overlap. Keywords that are word-level prefixes of a longer keyword
+    (e.g. "site" inside "site for sale") are resolved from a lookup table built
+    at construction time, so the result is the same as running
+    re.search(r'\\b' + re.escape(keyword) + r'\\b', text) for every keyword.
+
+    The regex is compiled on the first match, and to_snapshot()/from_snapshot() save and
+    restore everything else, so a matcher loaded from a snapshot costs almost nothing to create.
+    """
+
+    def __init__(self, keywords_by_tag):
+        # Tag order is kept so tags come out in the order they were declared
+        self.tags = list(keywords_by_tag)
+        self.keyword_tags = {}
+        for tag, keywords in keywords_by_tag.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if not keyword:
+                    continue
+                tags_for_keyword = self.keyword_tags.setdefault(keyword, [])
+                if tag not in tags_for_keyword:
+                    tags_for_keyword.append(tag)
+
+        keywords = sorted(self.keyword_tags, key=lambda kw: (-len(kw), kw))
+        self._prefixes = {kw: self._word_prefixes(kw, keywords) for kw in keywords}
+        if keywords:
+            alternation = "|".join(re.escape(kw) for kw in keywords)
+            self._pattern_source = r'(?=\b(' + alternation + r')\b)'
+        else:
+            self._pattern_source = None
+        self._pattern = None
+
+    def to_snapshot(self):
+        """The matcher's tables as a JSON-serializable dict."""
+        return {"tags": self.tags, "keyword_tags": self.keyword_tags, "prefixes": self._prefixes,
+                "pattern": self._pattern_source}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        matcher = cls.__new__(cls)
+        matcher.tags = list(snapshot["tags"])
+        matcher.keyword_tags = {kw: list(tags) for kw, tags in snapshot["keyword_tags"].items()}
+        matcher._prefixes = {kw: list(prefixes) for kw, prefixes in snapshot["prefixes"].items()}
+        matcher._pattern_source = snapshot["pattern"]
+        matcher._pattern = None
+        return matcher
+
+    def _compiled_pattern(self):
+        if self._pattern is None: # Compiling twice from racing threads is harmless
+            self._pattern = re.compile(self._pattern_source)
+        return self._pattern
+
+    @staticmethod
+    def _word_prefixes(keyword, keywords):
+        """Returns the shorter keywords that also match wherever `keyword` matches at the same position."""
+        prefixes = []
+        for other in keywords:
+            if len(other) >= len(keyword) or not keyword.startswith(other):
+                continue
+            # Same rule as the trailing \b: a boundary exists between the two characters
+            if re.match(re.escape(other) + r'\b', keyword):
+                prefixes.append(other)
+        return prefixes
+
+    def find_keywords(self, text):
+        """Returns the set of keywords found in an already lowercased text."""
+        found = set()
+        if self._pattern_source is None or not text:
+            return found
+        for match in self._compiled_pattern().finditer(text):
+            keyword = match.group(1)
+            if keyword not in found:
+                found.add(keyword)
+                found.update(self._prefixes[keyword])
+        return found
+
+    def match(self, text):
+        """
+        Returns (tags, keywords) for an already lowercased text.
+        Tags are in declaration order, keywords are sorted.
+        """
+        found = self.find_keywords(text)
+        hit_tags = set()
+        for keyword in found:
+            hit_tags.update(self.keyword_tags[keyword])
+        return [tag for tag in self.tags if tag in hit_tags], sorted(found)
+
+
+def normalize_keywords(user_keywords_str):
+    """Splits a comma separated keyword string into a sorted, de-duplicated, lowercased tuple."""
+    if not user_keywords_str or not isinstance(user_keywords_str, str):
+        return ()
+    return tuple(sorted({kw.strip().lower() for kw in user_keywords_str.split(',') if kw.strip()}))
+
+
+@lru_cache(maxsize=USER_MATCHER_CACHE_SIZE)
+def _compile_user_matcher(normalized_keywords, tag):
+    return KeywordMatcher({tag: normalized_keywords})
+
+
+def get_user_keyword_matcher(user_keywords_str, tag="Tag: User Keyword Match"):
+    """Returns a cached KeywordMatcher for a user keyword string, or None if it has no keywords."""
+    normalized_keywords = normalize_keywords(user_keywords_str)
+    if not normalized_keywords:
+        return None
+    return _compile_user_matcher(normalized_keywords, tag)
+
+
+# --- snapshots of the fixed matchers ---
+
+_snapshot_lock = threading.Lock()
+_registered = {} # name -> keywords_by_tag, for write_snapshot()
+_loaded_snapshot = None
+
+
+def _fingerprint(keywords_by_tag):
+    """Identifies the keyword lists a snapshot was built from, so stale snapshots are ignored."""
+    return hashlib.sha256(json.dumps(keywords_by_tag, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _read_snapshot(path):
+    global _loaded_snapshot
+    with _snapshot_lock:
+        if _loaded_snapshot is None:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _loaded_snapshot = json.load(f)
+            except FileNotFoundError:
+                _loaded_snapshot = {}
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable keyword matcher snapshot %s: %s", path, e)
+                _loaded_snapshot = {}
+        return _loaded_snapshot
+
+
+def load_matcher(name, keywords_by_tag, path=SNAPSHOT_PATH):
+    """
+    Returns the KeywordMatcher for a fixed set of keyword lists, restored from the snapshot
+    file when it holds one built from the same lists, otherwise built from scratch.
+    """
+    _registered[name] = keywords_by_tag
+    entry = _read_snapshot(path).get(name)
+    if entry and entry.get("fingerprint") == _fingerprint(keywords_by_tag):
+        return KeywordMatcher.from_snapshot(entry["matcher"])
+    if entry:
+        logger.info("Keyword matcher snapshot for %s is stale; building it (rerun python -m src.lib.keyword_matcher).", name)
+    return KeywordMatcher(keywords_by_tag)
+
+
+def write_snapshot(path=SNAPSHOT_PATH):
+    """Writes every matcher created through load_matcher to the snapshot file. Returns their names."""
+    snapshot = {name: {"fingerprint": _fingerprint(keywords_by_tag), "matcher": KeywordMatcher(keywords_by_tag).to_snapshot()}
+                for name, keywords_by_tag in sorted(_registered.items())}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=1, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp_path, path)
+    return sorted(snapshot)
+
+
+if __name__ == "__main__":
+    # Importing the modules that define fixed matchers registers them
+    import src.lib.daft_analyzer # noqa: F401
+    from src.lib.keyword_matcher import write_snapshot as write_registered_snapshot
+    print(f"Wrote {', '.join(write_registered_snapshot())} to {SNAPSHOT_PATH}")
@@ -0,0 +1,223 @@
+# listing_store.py
+
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta
+
+from src.lib.daft_analyzer import listing_id_from_url, parse_leading_int, parse_price
+from src.models.listing import Listing, ListingPriceChange, ListingTag, SearchSnapshot
+from src.models.user import db
+
+# How old stored listings and search snapshots may be before a search is crawled live again
+DEFAULT_MAX_AGE_SECONDS = 6 * 60 * 60
+
+# Keeps IN (...) clauses under SQLite's bound-parameter limit
+_CHUNK_SIZE = 500
+
+def normalize_place(name):
+    """Lowercases a place name and drops "Co." / "County" so "Co. Cork" and "Cork County" compare equal."""
+    name = (name or "").strip().lower()
+    name = re.sub(r'^(co\.?|county)\s+', '', name)
+    name = re.sub(r'\s+(co\.?|county)$', '', name)
+    return name
+
+
+def split_address(title):
+    """Returns (area, county) from a Daft title such as "12 Main Street, Gorey, Co. Wexford"."""
+    parts = [part.strip() for part in (title or "").split(",") if part.strip()]
+    county = normalize_place(parts[-1]) if parts else ""
+    area = normalize_place(parts[-2]) if len(parts) > 1 else ""
+    return area, county
+
+
+def search_snapshot_key(canonical_key):
+    return hashlib.sha256(canonical_key.encode("utf-8")).hexdigest()
+
+
+def _chunks(items):
+    for start in range(0, len(items), _CHUNK_SIZE):
+        yield items[start:start + _CHUNK_SIZE]
+
+
+# Set by an incremental crawl relative to the one before it; not part of the listing itself
+_PER_CRAWL_KEYS = ("change", "price_change")
+
+
+def _row_from_details(listing_id, details, scraped_at):
+    area, county = split_address(details.get("title"))
+    return {
+        "listing_id": listing_id,
+        "url": details.get("url", ""),
+        "title": details.get("title", ""),
+        "price": details.get("price", ""),
+        "price_value": parse_price(details.get("price")),
+        "beds": parse_leading_int(details.get("beds")),
+        "baths": parse_leading_int(details.get("baths")),
+        "county": county,
+        "area": area,
+        "property_type": (details.get("property_type") or "").strip().lower(),
+        "ber": (details.get("ber") or "").strip().upper(),
+        "description": details.get("description", ""),
+        # Listings scraped from their detail page carry no flag and are complete
+        "description_complete": details.get("description_complete", True),
+        "details_json": json.dumps({key: value for key, value in details.items() if key not in _PER_CRAWL_KEYS}),
+        "scraped_at": scraped_at,
+    }
+
+
+def upsert_listings(properties, scraped_at=None):
+    """
+    Inserts or updates analyzed listings in bulk, keyed by listing id. A stored full
+    description is kept when the new data only has the search snippet, and every change
+    of parsed price is recorded in the price history.
+    Returns the number of listings written.
+    """
+    scraped_at = scraped_at or datetime.utcnow()
+    by_id = {}
+    for details in properties:
+        listing_id = details.get("listing_id") or listing_id_from_url(details.get("url"))
+        if listing_id:
+            by_id[str(listing_id)] = details
+    if not by_id:
+        return 0
+
+    existing = {}
+    for chunk in _chunks(list(by_id)):
+        rows = db.session.query(Listing.listing_id, Listing.price, Listing.price_value,
+                                Listing.description_complete, Listing.details_json) \
+            .filter(Listing.listing_id.in_(chunk)).all()
+        existing.update({row.listing_id: row for row in rows})
+
+    inserts, updates, tags, price_changes = [], [], [], []
+    for listing_id, details in by_id.items():
+        stored = existing.get(listing_id)
+        if stored is not None and stored.description_complete and details.get("description_complete") is False:
+            kept = json.loads(stored.details_json)
+            details = dict(details, description=kept.get("description", ""), features=kept.get("features", []),
+                           description_complete=True)
+        row = _row_from_details(listing_id, details, scraped_at)
+        (updates if stored is not None else inserts).append(row)
+        if stored is not None and None not in (stored.price_value, row["price_value"]) \
+                and stored.price_value != row["price_value"]:
+            price_changes.append({
+                "listing_id": listing_id, "changed_at": scraped_at,
+                "old_price": stored.price, "new_price": row["price"],
+                "old_value": stored.price_value, "new_value": row["price_value"],
+            })
+        tags.extend({"listing_id": listing_id, "tag": tag} for tag in dict.fromkeys(details.get("analysis_tags", [])))
+
+    for chunk in _chunks(list(by_id)):
+        ListingTag.query.filter(ListingTag.listing_id.in_(chunk)).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(Listing, inserts)
+    db.session.bulk_update_mappings(Listing, updates)
+    db.session.bulk_insert_mappings(ListingTag, tags)
+    db.session.bulk_insert_mappings(ListingPriceChange, price_changes)
+    db.session.commit()
+    return len(by_id)
+
+
+def get_stored_details(urls, max_age=None, complete_only=False):
+    """
+    Returns {url: details} for stored listings among `urls`, optionally only those
+    scraped within max_age seconds and/or stored with their full description.
+    """
+    ids = {listing_id_from_url(url): url for url in urls}
+    ids.pop(None, None)
+    if not ids:
+        return {}
+    found = {}
+    for chunk in _chunks(list(ids)):
+        query = Listing.query.filter(Listing.listing_id.in_(chunk))
+        if complete_only:
+            query = query.filter(Listing.description_complete.is_(True))
+        if max_age is not None:
+            query = query.filter(Listing.scraped_at >= datetime.utcnow() - timedelta(seconds=max_age))
+        found.update({ids[row.listing_id]: row.to_dict() for row in query.all()})
+    return found
+
+
+def get_complete_details(urls, max_age=DEFAULT_MAX_AGE_SECONDS):
+    """Returns {url: details} for listings stored recently enough with their full description."""
+    return get_stored_details(urls, max_age=max_age, complete_only=True)
+
+
+def get_listing(listing_id):
+    """Returns the stored details of one listing, or None."""
+    listing = Listing.query.get(str(listing_id))
+    return listing.to_dict() if listing is not None else None
+
+
+def price_history(listing_id):
+    """Returns the recorded price changes of a listing, oldest first."""
+    changes = ListingPriceChange.query.filter_by(listing_id=str(listing_id)) \
+        .order_by(ListingPriceChange.changed_at).all()
+    return [change.to_dict() for change in changes]
+
+
+def query_listings(filters, max_age=DEFAULT_MAX_AGE_SECONDS, tag=None):
+    """Returns stored listings matching the filters dict (and optionally an analysis tag), newest first."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    query = apply_filters(Listing.query.filter(Listing.scraped_at >= cutoff), filters)
+    if tag:
+        query = query.join(ListingTag).filter(ListingTag.tag == tag)
+    return [listing.to_dict() for listing in query.order_by(Listing.scraped_at.desc(), Listing.listing_id).all()]
+
+
+# The filters apply_filters narrows by
+FILTER_NAMES = ("location", "propertyType", "minPrice", "maxPrice", "minBeds", "maxBeds")
+
+
+def active_filters(filters):
+    """The non-blank values in a filters dict that apply_filters would use."""
+    return {name: filters[name] for name in FILTER_NAMES if str(filters.get(name) or "").strip()}
+
+
+def apply_filters(query, filters):
+    """Narrows a query over Listing to the location, price, beds and property type in a filters dict."""
+    location = (filters.get("location") or "").strip()
+    if location and location.lower() != "ireland":
+        for term in (normalize_place(part) for part in location.split(",")):
+            if term:
+                query = query.filter(db.or_(Listing.county == term, Listing.area == term))
+
+    min_price, max_price = parse_price(str(filters.get("minPrice") or "")), parse_price(str(filters.get("maxPrice") or ""))
+    if min_price is not None:
+        query = query.filter(Listing.price_value >= min_price)
+    if max_price is not None:
+        query = query.filter(Listing.price_value <= max_price)
+
+    min_beds, max_beds = parse_leading_int(str(filters.get("minBeds") or "")), parse_leading_int(str(filters.get("maxBeds") or ""))
+    if min_beds is not None:
+        query = query.filter(Listing.beds >= min_beds)
+    if max_beds is not None:
+        query = query.filter(Listing.beds <= max_beds)
+
+    property_type = (filters.get("propertyType") or "").strip().lower()
+    if property_type and property_type != "any":
+        query = query.filter(Listing.property_type.contains(property_type))
+    return query
+
+
+def fresh_search_count(canonical_key, need_description=False, max_age=DEFAULT_MAX_AGE_SECONDS):
+    """
+    Returns how many listings this search found when it was last crawled live, or None
+    if that was too long ago (or without the descriptions that are now needed).
+    """
+    snapshot = db.session.get(SearchSnapshot, search_snapshot_key(canonical_key))
+    if snapshot is None or snapshot.crawled_at < datetime.utcnow() - timedelta(seconds=max_age):
+        return None
+    if need_description and not snapshot.with_descriptions:
+        return None
+    return snapshot.result_count
+
+
+def record_search(canonical_key, result_count, with_descriptions=False):
+    """Records that a search has just been crawled live."""
+    db.session.merge(SearchSnapshot(
+        search_key=search_snapshot_key(canonical_key),
+        crawled_at=datetime.utcnow(),
+        with_descriptions=with_descriptions,
+        result_count=result_count,
+    ))
+    db.session.commit()
@@ -0,0 +1,221 @@
+# metrics.py
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket upper bounds in seconds, from a cache hit to a slow multi-page crawl
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "value_finder_"
+
+
+def _label_key(label_names, labels):
+    missing = set(label_names) - set(labels)
+    if missing or len(labels) != len(label_names):
+        raise ValueError(f"expected labels {label_names}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in label_names)
+
+
+def _format_labels(label_names, key, extra=()):
+    pairs = list(zip(label_names, key)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(self.label_names, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name + "_total", _format_labels(self.label_names, key), value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, with their sum and count, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {} # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self, **labels):
+        """Returns {"count", "sum"} for one label set."""
+        with self._lock:
+            series = self._series.get(_label_key(self.label_names, labels))
+            return {"count": series[-1], "sum": series[-2]} if series else {"count": 0, "sum": 0.0}
+
+    def samples(self):
+        with self._lock:
+            all_series = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(all_series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                yield self.name + "_bucket", _format_labels(self.label_names, key, [("le", _format_value(bound))]), cumulative
+            yield self.name + "_bucket", _format_labels(self.label_names, key, [("le", "+Inf")]), series[-1]
+            yield self.name + "_sum", _format_labels(self.label_names, key), series[-2]
+            yield self.name + "_count", _format_labels(self.label_names, key), series[-1]
+
+
+class Registry:
+    """The set of metrics exposed at /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None: # Re-importing a module must not duplicate its metrics
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(METRIC_PREFIX + name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(METRIC_PREFIX + name, help_text, label_names, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- the application's metrics ---
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_seconds", "Time spent per pipeline stage (fetch, parse, extract, analyze, serialize...).", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram("request_seconds", "API request duration.", ("endpoint",))
+PAGES = REGISTRY.counter("search_pages", "Search results pages scraped.")
+LISTINGS = REGISTRY.counter("listings", "Listings returned by crawls.")
+ERRORS = REGISTRY.counter("errors", "Failed pages, by kind (search_page, detail_page).", ("kind",))
+HTTP_REQUESTS = REGISTRY.counter("http_requests", "Outgoing HTTP responses by status code.", ("status",))
+HTTP_RETRIES = REGISTRY.counter("http_retries", "Outgoing HTTP requests retried after an error or retryable status.")
+RESULT_CACHE = REGISTRY.counter("result_cache", "Analysis result cache lookups by status (hit, stale, miss).", ("status",))
+
+
+# --- per-request timing breakdown ---
+
+class StageTimings:
+    """
+    Accumulates seconds and call counts per stage for one request. Stages that run on
+    several threads at once (e.g. detail page fetches) add up to more than the wall time.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def to_dict(self):
+        with self._lock:
+            stages = {stage: {"seconds": round(seconds, 6), "count": count}
+                      for stage, (seconds, count) in self._stages.items()}
+        return {"total_seconds": round(time.perf_counter() - self.started, 6), "stages": stages}
+
+
+_current_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_timings():
+    """Collects a StageTimings breakdown for everything timed inside the block (and tasks started via submit_with_context)."""
+    timings = StageTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def submit_with_context(executor, fn, *args):
+    """executor.submit that carries the caller's context (and so its timing breakdown) into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Times the block into the stage histogram and the current request's breakdown, if any."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def render_metrics():
+    return REGISTRY.render()
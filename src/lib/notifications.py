@@ -0,0 +1,96 @@
+# notifications.py
+
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Where the file backend writes messages, one .eml file each
+DEFAULT_OUTBOX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "outbox")
+
+# The SMTP backend defaults to a local stub server, e.g. `python -m aiosmtpd -n -l localhost:1025`
+DEFAULT_SMTP_HOST = "localhost"
+DEFAULT_SMTP_PORT = 1025
+
+DEFAULT_FROM_ADDRESS = "alerts@value-finder.local"
+
+
+def build_message(to, subject, body):
+    from email.message import EmailMessage
+
+    message = EmailMessage()
+    message["From"] = os.getenv("ALERT_FROM", DEFAULT_FROM_ADDRESS)
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+class FileSender:
+    """Writes each message to `directory` as an .eml file instead of sending it."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv("ALERT_OUTBOX_DIR", DEFAULT_OUTBOX_DIR)
+
+    def send(self, message):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.eml")
+        with open(path, "wb") as f:
+            f.write(message.as_bytes())
+        logger.info("Wrote alert for %s to %s", message["To"], path)
+
+
+class SmtpSender:
+    """Sends messages through an SMTP server (SMTP_HOST/SMTP_PORT, optional SMTP_USER/SMTP_PASSWORD)."""
+
+    def __init__(self, host=None, port=None, username=None, password=None, timeout=10):
+        self.host = host or os.getenv("SMTP_HOST", DEFAULT_SMTP_HOST)
+        self.port = int(port or os.getenv("SMTP_PORT", DEFAULT_SMTP_PORT))
+        self.username = username or os.getenv("SMTP_USER")
+        self.password = password or os.getenv("SMTP_PASSWORD")
+        self.timeout = timeout
+
+    def send(self, message):
+        import smtplib # Only loaded when the SMTP backend is used
+
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.username:
+                smtp.starttls()
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+        logger.info("Sent alert to %s via %s:%d", message["To"], self.host, self.port)
+
+
+# Errors a sender may raise for one message (smtplib's errors are OSErrors too);
+# the alert stays pending and is retried with the next batch
+SEND_ERRORS = (OSError,)
+
+SENDERS = {"file": FileSender, "smtp": SmtpSender}
+
+_lock = threading.Lock()
+_sender = None
+
+
+def configure_sender(sender=None):
+    """
+    Sets the object alerts are sent through: anything with a send(EmailMessage) method.
+    None goes back to the ALERT_SENDER backend ("file", the default, or "smtp").
+    """
+    global _sender
+    with _lock:
+        _sender = sender
+
+
+def get_sender():
+    global _sender
+    with _lock:
+        if _sender is None:
+            backend = os.getenv("ALERT_SENDER", "file").strip().lower()
+            if backend not in SENDERS:
+                logger.warning("Unknown ALERT_SENDER=%r; writing alerts to files.", backend)
+                backend = "file"
+            _sender = SENDERS[backend]()
+        return _sender
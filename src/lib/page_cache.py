@@ -0,0 +1,219 @@
+# page_cache.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Defaults for the persistent response cache
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Response headers kept with a cached body
+_STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def normalize_url(url):
+    """Lowercases scheme and host, drops the fragment and default ports, and sorts query parameters."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def url_key(url):
+    """Cache key for a URL: sha256 of its normalized form."""
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def page_hash(content):
+    """Content hash used to key parsed-details entries."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class PageCache:
+    """
+    Persistent, size-bounded LRU cache of HTTP response bodies keyed by normalized URL.
+
+    Each entry is a body file plus a small JSON metadata file (ETag, Last-Modified,
+    fetch time). Entries older than `ttl` are not served directly; the HTTP client
+    revalidates them with a conditional GET instead. With `cache_parsed` enabled the
+    cache also stores parsed `details` dicts keyed by page hash, so an unchanged page
+    can skip HTML parsing entirely.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES, cache_parsed=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache_parsed = cache_parsed
+        self._pages_dir = os.path.join(directory, "pages")
+        self._parsed_dir = os.path.join(directory, "parsed")
+        os.makedirs(self._pages_dir, exist_ok=True)
+        os.makedirs(self._parsed_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict() # file name -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "revalidated": 0, "stores": 0,
+                       "evictions": 0, "bytes_served": 0, "bytes_stored": 0,
+                       "parsed_hits": 0, "parsed_misses": 0}
+        self._load_index()
+
+    # --- index bookkeeping ---
+
+    def _load_index(self):
+        """Rebuilds the LRU order from file access times left by earlier runs."""
+        entries = []
+        for sub_dir in (self._pages_dir, self._parsed_dir):
+            for name in os.listdir(sub_dir):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(sub_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, os.path.relpath(path, self.directory), stat.st_size))
+        for _, rel_path, size in sorted(entries):
+            self._index[rel_path] = size
+            self._total_bytes += size
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _touch(self, rel_path):
+        with self._lock:
+            if rel_path in self._index:
+                self._index.move_to_end(rel_path)
+
+    def _write(self, rel_path, data):
+        path = os.path.join(self.directory, rel_path)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path) # Atomic, so readers never see a partial file
+        with self._lock:
+            self._total_bytes += len(data) - self._index.pop(rel_path, 0)
+            self._index[rel_path] = len(data)
+            self._stats["bytes_stored"] += len(data)
+            evicted = self._evict_locked()
+        for evicted_path in evicted:
+            try:
+                os.remove(os.path.join(self.directory, evicted_path))
+            except OSError:
+                pass
+
+    def _evict_locked(self):
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            rel_path, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self._stats["evictions"] += 1
+            evicted.append(rel_path)
+        return evicted
+
+    def _read(self, rel_path):
+        try:
+            with open(os.path.join(self.directory, rel_path), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(rel_path)
+        return data
+
+    # --- page entries ---
+
+    def lookup(self, url):
+        """
+        Returns (meta, body, is_fresh) for a cached URL, or None on a miss.
+        Stale entries are still returned so their validators can be used.
+        """
+        key = url_key(url)
+        raw_meta = self._read(os.path.join("pages", key + ".json"))
+        body = self._read(os.path.join("pages", key + ".body")) if raw_meta is not None else None
+        if raw_meta is None or body is None:
+            self._count(misses=1)
+            return None
+        meta = json.loads(raw_meta)
+        is_fresh = time.time() - meta["fetched_at"] < self.ttl
+        if is_fresh:
+            self._count(hits=1, bytes_served=len(body))
+        else:
+            self._count(stale=1)
+        return meta, body, is_fresh
+
+    def conditional_headers(self, meta):
+        """If-None-Match / If-Modified-Since headers for revalidating a stale entry."""
+        headers = {}
+        if meta["headers"].get("ETag"):
+            headers["If-None-Match"] = meta["headers"]["ETag"]
+        if meta["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+        return headers
+
+    def store(self, url, response):
+        """Caches a successful response's body and validators."""
+        key = url_key(url)
+        meta = {
+            "url": normalize_url(url),
+            "fetched_at": time.time(),
+            "headers": {name: response.headers[name] for name in _STORED_HEADERS if name in response.headers},
+        }
+        self._write(os.path.join("pages", key + ".body"), response.content)
+        self._write(os.path.join("pages", key + ".json"), json.dumps(meta).encode("utf-8"))
+        self._count(stores=1)
+
+    def mark_revalidated(self, url, meta, body):
+        """Restarts the TTL of an entry the server confirmed unchanged (304)."""
+        meta = dict(meta, fetched_at=time.time())
+        self._write(os.path.join("pages", url_key(url) + ".json"), json.dumps(meta).encode("utf-8"))
+        self._count(revalidated=1, bytes_served=len(body))
+
+    def build_response(self, url, meta, body):
+        """Builds a requests.Response for a cached body so callers can't tell the difference."""
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response._content = body
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+
+    # --- parsed details entries ---
+
+    def get_parsed(self, content_hash):
+        """Returns the parsed details cached for a page hash, or None."""
+        if not self.cache_parsed:
+            return None
+        data = self._read(os.path.join("parsed", content_hash + ".json"))
+        if data is None:
+            self._count(parsed_misses=1)
+            return None
+        self._count(parsed_hits=1)
+        return json.loads(data)
+
+    def put_parsed(self, content_hash, details):
+        if self.cache_parsed:
+            self._write(os.path.join("parsed", content_hash + ".json"), json.dumps(details).encode("utf-8"))
+
+    def stats(self):
+        """Returns hit/miss/byte counters plus the current entry count and size on disk."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["files"] = len(self._index)
+            snapshot["bytes_on_disk"] = self._total_bytes
+        return snapshot
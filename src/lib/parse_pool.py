@@ -0,0 +1,113 @@
+# parse_pool.py
+
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# "spawn" children start clean instead of inheriting the parent's threads and held locks
+DEFAULT_START_METHOD = "spawn"
+
+# After this many broken pools, stop restarting and parse in-thread
+MAX_POOL_RESTARTS = 3
+
+
+def _workers_from_env():
+    """DAFT_PARSE_WORKERS: a process count, "auto" for one per CPU, or 0 (default) to parse in the calling thread."""
+    value = os.getenv("DAFT_PARSE_WORKERS", "0").strip().lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning("Ignoring invalid DAFT_PARSE_WORKERS=%r; parsing in-thread.", value)
+        return 0
+
+
+_lock = threading.Lock()
+_settings = {"workers": None, "start_method": os.getenv("DAFT_PARSE_START_METHOD", DEFAULT_START_METHOD),
+             "broken": 0}
+_pool = None
+
+
+def configure_parse_pool(workers=None, start_method=None):
+    """
+    Sets how many processes parse pages (0 parses in the calling thread; None re-reads
+    DAFT_PARSE_WORKERS). A running pool is shut down and replaced on next use.
+    """
+    global _pool
+    with _lock:
+        _settings["workers"] = workers
+        _settings["broken"] = 0
+        if start_method:
+            _settings["start_method"] = start_method
+        previous, _pool = _pool, None
+    if previous is not None:
+        previous.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_workers():
+    with _lock:
+        workers, broken = _settings["workers"], _settings["broken"]
+    if broken >= MAX_POOL_RESTARTS:
+        return 0
+    return _workers_from_env() if workers is None else workers
+
+
+def _get_pool():
+    global _pool
+    workers = parse_workers()
+    if workers <= 0:
+        return None
+    # multiprocessing is only imported once a pool is actually wanted
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _lock:
+        if _pool is None:
+            context = multiprocessing.get_context(_settings["start_method"])
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            logger.info("Started a parse pool with %d %s worker processes.", workers, _settings["start_method"])
+        return _pool
+
+
+def run_parse(fn, *args):
+    """
+    Runs fn(*args) on the parse pool and returns its result, or runs it in the calling
+    thread when no pool is configured. fn must be a module-level function whose
+    arguments and result pickle cheaply (page bytes in, compact dicts out).
+    The calling thread waits without holding the GIL, so fetch threads keep overlapping.
+    """
+    pool = _get_pool()
+    if pool is None:
+        return fn(*args)
+    from concurrent.futures.process import BrokenProcessPool
+
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a new pool next time and parse this page here
+        logger.warning("Parse pool broke; parsing in-thread and restarting the pool.")
+        _discard_pool(pool)
+        return fn(*args)
+
+
+def _discard_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+            _settings["broken"] += 1
+            if _settings["broken"] >= MAX_POOL_RESTARTS:
+                logger.error("Parse pool broke %d times; parsing in-thread from now on.", _settings["broken"])
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def _shutdown_pool():
+    with _lock:
+        pool = _pool
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,78 @@
+# rate_limiter.py
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Politeness defaults for requests to a single host
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_BURST = 2
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill at `rate` per second up to `burst`;
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Takes a token if one is available right now. Returns True on success."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """Blocks until a token is available and takes it. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+_host_limit_settings = {"rate": DEFAULT_REQUESTS_PER_SECOND, "burst": DEFAULT_BURST}
+
+
+def configure_rate_limit(rate=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST):
+    """Sets the requests/sec and burst used for every host. Existing buckets are replaced."""
+    TokenBucket(rate, burst) # Validate before touching shared state
+    with _host_limiters_lock:
+        _host_limit_settings["rate"] = rate
+        _host_limit_settings["burst"] = burst
+        _host_limiters.clear()
+
+
+def get_host_limiter(url):
+    """Returns the shared TokenBucket for the host of `url`, creating it on first use."""
+    host = urlsplit(url).netloc.lower()
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            limiter = TokenBucket(_host_limit_settings["rate"], _host_limit_settings["burst"])
+            _host_limiters[host] = limiter
+        return limiter
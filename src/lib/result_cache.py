@@ -0,0 +1,140 @@
+# result_cache.py
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.lib.metrics import RESULT_CACHE
+from src.lib.result_payload import dumps
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the in-memory analysis result cache
+DEFAULT_TTL_SECONDS = 10 * 60
+DEFAULT_STALE_SECONDS = 50 * 60 # Served stale (while refreshing) this long after going stale
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+CACHE_HIT = "hit"
+CACHE_STALE = "stale"
+CACHE_MISS = "miss"
+CACHE_BYPASS = "bypass"
+
+
+class ResultCache:
+    """
+    Analysis results keyed by canonical search (see canonical_search_key), so searches that
+    differ only in case, whitespace or parameter order share one entry.
+
+    An entry is fresh for `ttl` seconds. For `stale_ttl` seconds after that it is still
+    served straight away while one background refresh recomputes it (stale-while-revalidate);
+    older entries are recomputed in the request. Entries are sized by their serialized
+    JSON and the least recently used are evicted beyond `max_bytes`. Concurrent misses for
+    the same key wait for one computation instead of each crawling.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, stale_ttl=DEFAULT_STALE_SECONDS, max_bytes=DEFAULT_MAX_BYTES,
+                 refresh_workers=1):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (stored at, value, size in bytes), least recently used first
+        self._total_bytes = 0
+        self._computing = {} # key -> Event set when the in-request computation finishes
+        self._refreshing = set()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=max(1, refresh_workers),
+                                                    thread_name_prefix="result-refresh")
+
+    def get(self, key, compute, cacheable=lambda value: True, refresh=None):
+        """
+        Returns (value, status, age) for key, calling compute() on a miss or, in the background,
+        refresh() (compute() unless given) for a stale entry. status is "hit", "stale" or "miss";
+        age is the served value's age in seconds. Values for which cacheable(value) is false are
+        returned but not kept.
+        """
+        while True:
+            with self._lock:
+                cached = self._cached(key, refresh or compute, cacheable)
+                if cached is not None:
+                    return cached
+                waiting = self._computing.get(key)
+                if waiting is None:
+                    done = self._computing[key] = threading.Event()
+                    break
+            waiting.wait() # Another request is computing this key; use its result if it was kept
+
+        RESULT_CACHE.inc(status=CACHE_MISS)
+        try:
+            value = compute()
+            if cacheable(value):
+                self.put(key, value)
+            return value, CACHE_MISS, 0.0
+        finally:
+            with self._lock:
+                del self._computing[key]
+            done.set()
+
+    def lookup(self, key, refresh, cacheable=lambda value: True):
+        """
+        Like get, but returns None on a miss instead of computing, for callers that build the
+        value themselves as they go and put() it. A stale entry is still refreshed with refresh().
+        """
+        with self._lock:
+            cached = self._cached(key, refresh, cacheable)
+        if cached is None:
+            RESULT_CACHE.inc(status=CACHE_MISS)
+        return cached
+
+    def _cached(self, key, refresh, cacheable):
+        """(value, status, age) of a servable entry, or None; a stale one is queued for refresh. Needs the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[0]
+        if age > self.ttl + self.stale_ttl:
+            return None
+        self._entries.move_to_end(key)
+        status = CACHE_HIT if age <= self.ttl else CACHE_STALE
+        if status == CACHE_STALE and key not in self._refreshing:
+            self._refreshing.add(key)
+            self._refresh_executor.submit(self._refresh, key, refresh, cacheable)
+        RESULT_CACHE.inc(status=status)
+        return entry[1], status, age
+
+    def _refresh(self, key, compute, cacheable):
+        try:
+            value = compute()
+            if cacheable(value):
+                self.put(key, value)
+                logger.info("Refreshed stale cached result for %s", key)
+        except Exception as e: # The stale entry keeps being served until it expires
+            logger.warning("Background refresh failed for %s: %s", key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def put(self, key, value):
+        """Stores value under key, unless its serialized size exceeds max_bytes."""
+        size = len(dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[2]
+            self._entries[key] = (time.monotonic(), value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
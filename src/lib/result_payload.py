@@ -0,0 +1,232 @@
+# result_payload.py
+
+import base64
+import binascii
+import gzip
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from src.lib.daft_analyzer import listing_id_from_url
+
+try: # orjson serializes several times faster than the json module
+    import orjson
+except ImportError:
+    orjson = None
+
+try: # Optional: brotli beats gzip on JSON, but gzip is always available
+    import brotli
+except ImportError:
+    brotli = None
+
+# Upper bound for the "limit" page size
+MAX_PAGE_SIZE = 500
+
+# Result sets kept for cursor paging and full-description lookups
+DEFAULT_RESULT_SET_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_RESULT_SETS = 32
+
+# Bodies smaller than this aren't worth compressing; levels favour speed over the last few percent
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+
+def dumps(obj):
+    """JSON-encodes obj to UTF-8 bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+# --- request options ---
+
+def _positive_int(value, name, maximum=None):
+    if value is None or value == "":
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a positive integer")
+    if number <= 0:
+        raise ValueError(f"{name} must be a positive integer")
+    return min(number, maximum) if maximum else number
+
+
+def payload_options(source):
+    """
+    Reads the response shaping options from a request's JSON body or query args:
+      fields             list or comma separated keys to return per listing (listing_id is always kept)
+      limit              page size; the response then carries "next_cursor" while more results remain
+      cursor             a "next_cursor" from an earlier response, to fetch the following page
+      descriptionLength  truncate descriptions to about this many characters
+    Raises ValueError for invalid values.
+    """
+    fields = source.get("fields")
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(",")]
+    if fields is not None and not isinstance(fields, list):
+        raise ValueError("fields must be a list or a comma separated string")
+    if fields is not None:
+        fields = tuple(field for field in fields if isinstance(field, str) and field) or None
+    cursor = source.get("cursor") or None
+    if cursor is not None and not isinstance(cursor, str):
+        raise ValueError("cursor must be a string")
+    return {
+        "fields": fields,
+        "limit": _positive_int(source.get("limit"), "limit", MAX_PAGE_SIZE),
+        "cursor": cursor,
+        "description_length": _positive_int(source.get("descriptionLength"), "descriptionLength"),
+    }
+
+
+# --- shaping listings ---
+
+def truncate_text(text, limit):
+    """Cuts text to at most `limit` characters, at a word boundary when one is near, and adds an ellipsis."""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    if space > limit * 0.6:
+        cut = cut[:space]
+    return cut.rstrip(" \n,;:.-") + "…"
+
+
+def listing_id_of(details):
+    return str(details.get("listing_id") or listing_id_from_url(details.get("url")) or "")
+
+
+def shape_listing(details, fields=None, description_length=None):
+    """
+    Returns the listing with only `fields` (plus listing_id) and its description truncated to
+    description_length, flagged with "description_truncated". The full text is available
+    from /api/listings/<listing_id>/description. The input dict is not modified.
+    """
+    truncated = description_length is not None and len(details.get("description") or "") > description_length
+    if fields is None and not truncated:
+        return details
+    if fields is None:
+        listing = dict(details)
+    else:
+        listing = {field: details[field] for field in fields if field in details}
+        listing["listing_id"] = listing_id_of(details)
+    if truncated and (fields is None or "description" in fields):
+        listing["description"] = truncate_text(details["description"], description_length)
+        listing["description_truncated"] = True
+        listing["listing_id"] = listing_id_of(details)
+    return listing
+
+
+# --- cursors ---
+
+def encode_cursor(result_id, offset):
+    return base64.urlsafe_b64encode(f"{result_id}:{offset}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns (result_id, offset) from a cursor made by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        result_id, offset = decoded.rsplit(":", 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("cursor is not valid")
+    if not result_id or offset < 0:
+        raise ValueError("cursor is not valid")
+    return result_id, offset
+
+
+class ResultSets:
+    """
+    Recent full result sets, kept for `ttl` seconds after their last use (at most `max_sets`,
+    least recently used dropped first) so later pages and full descriptions are served without crawling again.
+    Result sets live in this process only; a cursor that reaches another instance, or
+    outlives the ttl, has to start over.
+    """
+
+    def __init__(self, ttl=DEFAULT_RESULT_SET_TTL_SECONDS, max_sets=DEFAULT_MAX_RESULT_SETS):
+        self.ttl = ttl
+        self.max_sets = max_sets
+        self._lock = threading.Lock()
+        self._sets = OrderedDict() # result id -> (last used, results, {listing id: details}), oldest first
+
+    def _evict(self, now):
+        while self._sets and (len(self._sets) > self.max_sets or next(iter(self._sets.values()))[0] < now - self.ttl):
+            self._sets.popitem(last=False)
+
+    def put(self, results, result_id=None):
+        """Keeps a result list and returns its id; an existing id is refreshed, not replaced."""
+        now = time.monotonic()
+        result_id = result_id or uuid.uuid4().hex
+        with self._lock:
+            if result_id in self._sets:
+                _, results, by_id = self._sets.pop(result_id)
+            else:
+                by_id = {listing_id_of(details): details for details in results}
+            self._sets[result_id] = (now, results, by_id)
+            self._evict(now)
+        return result_id
+
+    def get(self, result_id):
+        """Returns a kept result list, or None if it is unknown or expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sets.pop(result_id, None)
+            if entry is None:
+                return None
+            self._sets[result_id] = (now,) + entry[1:]
+            return entry[1]
+
+    def find_listing(self, listing_id):
+        """Returns the newest kept details for a listing id, or None."""
+        with self._lock:
+            self._evict(time.monotonic())
+            for _, _, by_id in reversed(self._sets.values()):
+                if listing_id in by_id:
+                    return by_id[listing_id]
+        return None
+
+
+def page_of(results, offset, limit, result_id, fields=None, description_length=None):
+    """Returns {"results", "total", "next_cursor"} for results[offset:offset + limit], shaped."""
+    page = results[offset:offset + limit] if limit else results[offset:]
+    next_offset = offset + len(page)
+    return {
+        "results": [shape_listing(details, fields, description_length) for details in page],
+        "total": len(results),
+        "next_cursor": encode_cursor(result_id, next_offset) if limit and next_offset < len(results) else None,
+    }
+
+
+# --- compression ---
+
+def _accepted_encodings(accept_encoding):
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+    return {coding for coding, quality in accepted.items() if quality > 0}
+
+
+def compress(body, accept_encoding, min_bytes=COMPRESS_MIN_BYTES):
+    """Returns (body, content encoding or None) for the best encoding the client accepts."""
+    if len(body) < min_bytes:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if "gzip" in accepted or "*" in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
@@ -0,0 +1,305 @@
+# valuation.py
+
+import logging
+import re
+
+try: # The comparables engine needs NumPy; without it listings are returned unscored
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from src.lib.daft_analyzer import parse_leading_int, parse_price
+from src.lib.listing_store import split_address
+
+logger = logging.getLogger(__name__)
+
+# An area/type group needs this many priced listings before its statistics are used;
+# smaller groups fall back to the county/type group
+MIN_COMPARABLES = 5
+
+# Listings priced in the cheapest quarter of their comparables are tagged
+GOOD_VALUE_PERCENTILE = 25.0
+GOOD_VALUE_TAG = "Tag: Good Value"
+
+# Best to worst, so a lower rank is a better energy rating
+BER_RATINGS = ("A1", "A2", "A3", "B1", "B2", "B3", "C1", "C2", "C3", "D1", "D2", "E1", "E2", "F", "G")
+_BER_RANKS = {rating: rank for rank, rating in enumerate(BER_RATINGS)}
+
+_FLOOR_AREA_RE = re.compile(r'(\d[\d,]*(?:\.\d+)?)\s*(m²|m2|sq\.?\s?m|ft²|ft2|sq\.?\s?ft)?', re.IGNORECASE)
+_SQFT_TO_SQM = 0.09290304
+
+# Value metrics in order of preference: price per m² compares best, the plain price worst
+VALUE_METRICS = ("price_per_sqm", "price_per_bed", "price")
+
+
+def parse_floor_area(value):
+    """Returns the floor area in m² from a value such as "120 m²" or "1,100 sq ft", or None."""
+    match = _FLOOR_AREA_RE.search(value or "")
+    if not match:
+        return None
+    area = float(match.group(1).replace(",", ""))
+    unit = (match.group(2) or "m²").lower()
+    if "ft" in unit:
+        area *= _SQFT_TO_SQM
+    return area or None
+
+
+def parse_ber(value):
+    """Returns the rank of a BER rating such as "C1" in BER_RATINGS (0 is A1), or None."""
+    return _BER_RANKS.get((value or "").strip().upper()[:2]) if value else None
+
+
+def _parse_each_once(raw_values, parse):
+    """Parses each distinct raw value once; result sets repeat most values ("3 Bed", "C1", "Detached")."""
+    parsed = {}
+    for raw in raw_values:
+        if raw not in parsed:
+            parsed[raw] = parse(raw)
+    return [parsed[raw] for raw in raw_values]
+
+
+def _address_tail(title):
+    """The last two parts of a title, which are all split_address looks at, so it can be parsed once per place."""
+    parts = (title or "").rsplit(",", 2)
+    if len(parts) == 3 and parts[1].strip() and parts[2].strip():
+        return parts[1] + "," + parts[2]
+    return title or ""
+
+
+def listing_columns(listings):
+    """
+    Parses a result set into NumPy columns in one pass: price, beds, baths, floor_area
+    (m²) and ber as float arrays with NaN for missing values, price_per_bed and
+    price_per_sqm derived from them, and area, county and property_type as string arrays.
+    """
+    raw = [(details.get("price"), details.get("beds"), details.get("baths"), details.get("floor_area"),
+            details.get("ber"), _address_tail(details.get("title")), details.get("property_type"))
+           for details in listings]
+    prices, beds, baths, floor_areas, bers, tails, property_types = zip(*raw)
+    places = _parse_each_once(tails, split_address)
+
+    columns = {
+        # dtype=float turns the Nones into NaN
+        "price": np.array(_parse_each_once(prices, parse_price), dtype=float),
+        "beds": np.array(_parse_each_once(beds, parse_leading_int), dtype=float),
+        "baths": np.array(_parse_each_once(baths, parse_leading_int), dtype=float),
+        "floor_area": np.array(_parse_each_once(floor_areas, parse_floor_area), dtype=float),
+        "ber": np.array(_parse_each_once(bers, parse_ber), dtype=float),
+        "area": np.array([area for area, _ in places], dtype=str),
+        "county": np.array([county for _, county in places], dtype=str),
+        "property_type": np.array(_parse_each_once(property_types, lambda value: (value or "").strip().lower()), dtype=str),
+    }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns["price_per_bed"] = np.where(columns["beds"] > 0, columns["price"] / columns["beds"], np.nan)
+        columns["price_per_sqm"] = np.where(columns["floor_area"] > 0, columns["price"] / columns["floor_area"], np.nan)
+    return columns
+
+
+def _group_ids(*key_columns):
+    """Returns (group id per row, unique key tuples) for rows grouped by the given string columns."""
+    keys = key_columns[0]
+    for column in key_columns[1:]:
+        keys = np.char.add(np.char.add(keys, "\x1f"), column)
+    unique_keys, ids = np.unique(keys, return_inverse=True)
+    return ids.ravel(), [tuple(key.split("\x1f")) for key in unique_keys.tolist()]
+
+
+def grouped_stats(group_ids, group_count, values):
+    """
+    Per-group statistics of `values` ignoring NaN, computed without a Python loop over rows.
+
+    Returns a dict of per-group arrays (count, p25, median, p75, mean, std) plus
+    "percentile": each row's percentile rank within its group (ties share their
+    average rank; NaN where the value is missing).
+    """
+    row_count = len(values)
+    valid = ~np.isnan(values)
+    ids, vals = group_ids[valid], values[valid]
+
+    # Sort by group, then by value, so each group is one contiguous sorted run
+    order = np.lexsort((vals, ids))
+    ids_sorted, vals_sorted = ids[order], vals[order]
+    counts = np.bincount(ids_sorted, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(int)
+
+    stats = {"count": counts}
+    for name, q in (("p25", 0.25), ("median", 0.5), ("p75", 0.75)):
+        stats[name] = _sorted_quantile(vals_sorted, starts, counts, q)
+
+    sums = np.bincount(ids, weights=vals, minlength=group_count)
+    squares = np.bincount(ids, weights=vals * vals, minlength=group_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stats["mean"] = np.where(counts > 0, sums / counts, np.nan)
+        stats["std"] = np.sqrt(np.maximum(np.where(counts > 0, squares / counts, np.nan) - stats["mean"] ** 2, 0))
+
+    # Average position of each run of equal values, relative to the start of its group
+    positions = np.arange(len(vals_sorted))
+    new_run = np.ones(len(vals_sorted), dtype=bool)
+    new_run[1:] = (ids_sorted[1:] != ids_sorted[:-1]) | (vals_sorted[1:] != vals_sorted[:-1])
+    run_ids = np.cumsum(new_run) - 1
+    run_starts = positions[new_run]
+    run_lengths = np.bincount(run_ids)
+    mean_positions = run_starts[run_ids] + (run_lengths[run_ids] - 1) / 2.0
+    ranks = mean_positions - starts[ids_sorted]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sorted_percentiles = np.where(counts[ids_sorted] > 1, 100.0 * ranks / (counts[ids_sorted] - 1), 50.0)
+
+    percentile = np.full(row_count, np.nan)
+    valid_rows = np.flatnonzero(valid)
+    percentile[valid_rows[order]] = sorted_percentiles
+    stats["percentile"] = percentile
+    return stats
+
+
+def _sorted_quantile(vals_sorted, starts, counts, q):
+    """Linear-interpolated quantile of each group's sorted run; NaN for empty groups."""
+    if not len(vals_sorted):
+        return np.full(len(counts), np.nan)
+    positions = starts + q * np.maximum(counts - 1, 0)
+    low = np.clip(np.floor(positions).astype(int), 0, len(vals_sorted) - 1)
+    high = np.clip(np.ceil(positions).astype(int), 0, len(vals_sorted) - 1)
+    values = vals_sorted[low] + (vals_sorted[high] - vals_sorted[low]) * (positions - low)
+    return np.where(counts > 0, values, np.nan)
+
+
+def _metric_scores(columns, metric, area_ids, area_count, county_ids, county_count):
+    """
+    Scores one metric per row against its area/type group, or its county/type group when
+    the area has fewer than MIN_COMPARABLES priced listings. Returns a dict of row arrays.
+    """
+    values = columns[metric]
+    area_stats = grouped_stats(area_ids, area_count, values)
+    county_stats = grouped_stats(county_ids, county_count, values)
+    use_area = area_stats["count"][area_ids] >= MIN_COMPARABLES
+
+    def pick(name):
+        if name == "percentile": # Already one value per row
+            return np.where(use_area, area_stats[name], county_stats[name])
+        return np.where(use_area, area_stats[name][area_ids], county_stats[name][county_ids])
+
+    comparables = pick("count")
+    enough = comparables >= MIN_COMPARABLES
+    std = pick("std")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_score = np.where(std > 0, (values - pick("mean")) / std, 0.0)
+    return {
+        "level": np.where(use_area, "area", "county"),
+        "comparables": np.where(enough, comparables, 0),
+        "median": np.where(enough, pick("median"), np.nan),
+        "percentile": np.where(enough, pick("percentile"), np.nan),
+        "z_score": np.where(enough & ~np.isnan(values), z_score, np.nan),
+    }
+
+
+def _json_list(values, digits=None):
+    """Converts a float array to a list with NaN as None, rounding first, without a per-value Python loop."""
+    if digits is not None:
+        values = np.round(values, digits)
+    missing = np.isnan(values)
+    values = values.astype(object)
+    values[missing] = None
+    return values.tolist()
+
+
+def score_listings(listings):
+    """
+    Returns copies of the listings with a "valuation" dict each: parsed price, price per
+    bed and per m², the group the listing was compared against, its percentile and z-score
+    on the best available value metric, and a 0-100 "value_score" (100 is the cheapest of
+    its comparables). Listings without enough comparables get a value_score of None.
+    Listings in the cheapest GOOD_VALUE_PERCENTILE of their group are tagged GOOD_VALUE_TAG.
+    """
+    if not listings:
+        return []
+    if not NUMPY_AVAILABLE:
+        logger.warning("NumPy is not installed; skipping valuation.")
+        return [dict(details) for details in listings]
+
+    columns = listing_columns(listings)
+    area_ids, area_keys = _group_ids(columns["area"], columns["county"], columns["property_type"])
+    county_ids, county_keys = _group_ids(columns["county"], columns["property_type"])
+    scores = [_metric_scores(columns, metric, area_ids, len(area_keys), county_ids, len(county_keys))
+              for metric in VALUE_METRICS]
+
+    # Each row is valued on the first metric with enough comparables
+    chosen = np.full(len(listings), len(VALUE_METRICS))
+    for index in reversed(range(len(VALUE_METRICS))):
+        chosen = np.where(~np.isnan(scores[index]["percentile"]), index, chosen)
+    rows = np.arange(len(listings))
+    scored = chosen < len(VALUE_METRICS)
+    pick = np.minimum(chosen, len(VALUE_METRICS) - 1)
+
+    def chosen_score(name):
+        return np.stack([metric_scores[name] for metric_scores in scores])[pick, rows]
+
+    percentile = np.where(scored, chosen_score("percentile"), np.nan)
+    level = np.where(scored, chosen_score("level"), "")
+
+    # Build every output column as a list first, so the per-listing loop only assembles dicts
+    metric_names = np.array(VALUE_METRICS + (None,), dtype=object)[chosen].tolist()
+    group_areas = np.where(level == "area", columns["area"], "").tolist()
+    counties, property_types = columns["county"].tolist(), columns["property_type"].tolist()
+    price = _json_list(columns["price"])
+    per_bed, per_sqm = _json_list(columns["price_per_bed"], 0), _json_list(columns["price_per_sqm"], 0)
+    comparables = np.where(scored, chosen_score("comparables"), 0).tolist()
+    group_median = _json_list(np.where(scored, chosen_score("median"), np.nan), 0)
+    z_score = _json_list(np.where(scored, chosen_score("z_score"), np.nan), 2)
+    good_value = (percentile <= GOOD_VALUE_PERCENTILE).tolist()
+    value_score = _json_list(100.0 - np.round(percentile, 1), 1)
+    percentile = _json_list(percentile, 1)
+
+    results = []
+    for i, details in enumerate(listings):
+        details = dict(details)
+        details["valuation"] = {
+            "price_value": price[i],
+            "price_per_bed": per_bed[i],
+            "price_per_sqm": per_sqm[i],
+            "metric": metric_names[i],
+            "group": {"area": group_areas[i], "county": counties[i], "property_type": property_types[i]} if metric_names[i] else None,
+            "comparables": comparables[i],
+            "group_median": group_median[i],
+            "percentile": percentile[i],
+            "z_score": z_score[i],
+            "value_score": value_score[i],
+        }
+        if good_value[i] and GOOD_VALUE_TAG not in details.get("analysis_tags", []):
+            details["analysis_tags"] = list(details.get("analysis_tags", [])) + [GOOD_VALUE_TAG]
+        results.append(details)
+    return results
+
+
+def area_statistics(listings):
+    """
+    Returns one dict per area/county/property type group of the listings: listing count,
+    price quartiles and the median price per bed and per m², largest groups first.
+    """
+    if not listings or not NUMPY_AVAILABLE:
+        return []
+    columns = listing_columns(listings)
+    ids, keys = _group_ids(columns["area"], columns["county"], columns["property_type"])
+    sizes = np.bincount(ids, minlength=len(keys))
+    price = grouped_stats(ids, len(keys), columns["price"])
+    per_bed = grouped_stats(ids, len(keys), columns["price_per_bed"])
+    per_sqm = grouped_stats(ids, len(keys), columns["price_per_sqm"])
+    price_p25, price_median, price_p75 = (_json_list(price[name], 0) for name in ("p25", "median", "p75"))
+    per_bed_median, per_sqm_median = _json_list(per_bed["median"], 0), _json_list(per_sqm["median"], 0)
+
+    groups = []
+    for index, (area, county, property_type) in enumerate(keys):
+        groups.append({
+            "area": area,
+            "county": county,
+            "property_type": property_type,
+            "listings": int(sizes[index]),
+            "priced": int(price["count"][index]),
+            "price_p25": price_p25[index],
+            "price_median": price_median[index],
+            "price_p75": price_p75[index],
+            "price_per_bed_median": per_bed_median[index],
+            "price_per_sqm_median": per_sqm_median[index],
+        })
+    groups.sort(key=lambda group: (-group["listings"], group["county"], group["area"], group["property_type"]))
+    return groups
@@ -2,68 +2,683 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__))) # DON'T CHANGE THIS !!!
 
-from flask import Flask, request, jsonify, render_template
-from src.lib.daft_analyzer import fetch_daft_listings, analyze_listings
+import hashlib
+import logging
+import time
+from functools import lru_cache
+
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context, url_for
+from sqlalchemy.exc import SQLAlchemyError
+from src.lib.daft_analyzer import fetch_daft_listings, analyze_listings, iter_daft_listings, canonical_search_key, \
+    needs_description
+from src.lib.job_queue import DEFAULT_JOB_WORKERS, DEFAULT_RESULT_TTL_SECONDS, JOB_FAILED, JobManager
+from src.lib import alerts, fulltext, listing_store
+from src.lib.listing_store import DEFAULT_MAX_AGE_SECONDS
+from src.lib.metrics import PROMETHEUS_CONTENT_TYPE, REQUEST_SECONDS, collect_timings, render_metrics, timed
+from src.lib.result_cache import CACHE_BYPASS, CACHE_MISS, DEFAULT_MAX_BYTES as DEFAULT_RESULT_CACHE_BYTES, DEFAULT_STALE_SECONDS, \
+    DEFAULT_TTL_SECONDS as DEFAULT_RESULT_CACHE_TTL, ResultCache
+from src.lib.result_payload import (DEFAULT_MAX_RESULT_SETS, DEFAULT_RESULT_SET_TTL_SECONDS, ResultSets, compress,
+                                    decode_cursor, dumps, page_of, payload_options, shape_listing)
+from src.models import listing, saved_search # noqa: F401 - registers the listing and alert tables with db
+from src.models.user import db
+
+# Level-controlled logging; per-page and per-listing detail only shows with LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s [%(name)s] %(message)s')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='static', template_folder='static')
 
+# Static files linked through url_for carry a content hash (?v=...), so browsers can keep them this long
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 365 * 24 * 60 * 60))
+
 # Uncomment the following line if you need to use mysql, do not modify the SQLALCHEMY_DATABASE_URI configuration
 # app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{os.getenv('DB_USERNAME', 'root')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '3306')}/{os.getenv('DB_NAME', 'mydb')}"
 
+# Listing store: local SQLite unless LISTING_DB_URI is set (the mysql URI above wins when uncommented)
+LISTING_DB_DIR = os.path.join(os.path.dirname(__file__), 'database')
+app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.getenv('LISTING_DB_URI', f"sqlite:///{os.path.join(LISTING_DB_DIR, 'app.db')}"))
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+# Searches crawled live within this many seconds are answered from the store
+LISTING_MAX_AGE = float(os.getenv('LISTING_MAX_AGE', DEFAULT_MAX_AGE_SECONDS))
+LISTING_STORE_ENABLED = os.getenv('LISTING_STORE', '1') != '0'
+# Stored listings this recent feed /api/comparables (default 30 days)
+COMPARABLES_MAX_AGE = float(os.getenv('COMPARABLES_MAX_AGE', 30 * 24 * 60 * 60))
+# Newly crawled listings are matched against saved searches (needs the listing store's database)
+ALERTS_ENABLED = os.getenv('ALERTS', '1') != '0'
+# Ranked keyword search over stored listings (SQLite FTS5), kept up to date as listings are stored
+FULLTEXT_ENABLED = False
+if LISTING_STORE_ENABLED:
+    try:
+        os.makedirs(LISTING_DB_DIR, exist_ok=True)
+        with app.app_context():
+            db.create_all()
+            FULLTEXT_ENABLED = fulltext.ensure_fulltext_index()
+    except (OSError, SQLAlchemyError) as e: # e.g. a read-only filesystem; scrape live instead
+        logger.warning("Listing store unavailable, scraping live only: %s", e)
+        LISTING_STORE_ENABLED = False
+ALERTS_ENABLED = ALERTS_ENABLED and LISTING_STORE_ENABLED
+
 @app.route('/')
 def index():
     return render_template("index.html")
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_properties_route(): # Renamed to avoid conflict with imported function if any
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "Invalid request", "details": "No JSON data received"}), 400
+@lru_cache(maxsize=None)
+def _static_version(filename):
+    """Short content hash of a static file; it changes whenever the file does (i.e. on deploy)."""
+    try:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        return None
+
+@app.url_defaults
+def _add_static_version(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        version = _static_version(values['filename'])
+        if version:
+            values['v'] = version
+
+@app.after_request
+def _static_cache_headers(response):
+    # Only a URL with the current hash may be cached for good; a bare or outdated one is revalidated
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        filename = (request.view_args or {}).get('filename')
+        if filename and request.args.get('v') == _static_version(filename):
+            response.cache_control.no_cache = None # send_file defaults to revalidating
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+    return response
+
+def _completion_message(count, email):
+    message = f"Analysis complete. Found and analyzed {count} properties."
+    if email:
+        message += f" If this were live, an email notification would be sent to {email}."
+        # Placeholder for actual email sending logic
+        # send_email(email, "Property Analysis Results", f"Your analysis is complete. Results: {analyzed_results}")
+        logger.info("Email sending to %s would happen here with actual results.", email)
+    return message
+
+NO_RESULTS_MESSAGE = "No properties found matching your criteria from Daft.ie."
+
+def _mark_stopped(body, page):
+    """Marks a result cut short by an incremental crawl that stopped after `page`."""
+    body["complete"] = False
+    body["stopped_at_page"] = page
+    body["message"] += (f" Re-crawl stopped after page {page}, which had nothing new or changed;"
+                        " listings on later pages are not included.")
+    return body
+
+def _wants_stream(data):
+    """Streaming is requested with {"stream": true} or an NDJSON Accept header."""
+    return bool(data.get("stream")) or "application/x-ndjson" in request.headers.get("Accept", "")
+
+def _stream_analysis(filters, user_keywords_str, email, options):
+    """
+    Yields newline-delimited JSON: page/property/error events from iter_daft_listings
+    as they happen, then one {"type": "valuation"} record scoring the whole result set
+    and one {"type": "summary"} record. Properties are shaped by the fields and
+    descriptionLength options; paging doesn't apply to a stream. Like cached_analysis, a
+    cached result set is streamed straight back and a complete crawl is cached; like
+    run_analysis, a search crawled recently is served from the listing store and a crawl
+    is saved to it. The summary's "cache" is {"status", "age"} as in JSON responses.
+    """
+    count = 0
+    errors = []
+    properties = []
+    stopped_at = None
+    cache_key, cached, stored = None, None, None
+    need_description = needs_description(filters, user_keywords_str)
+    incremental = LISTING_STORE_ENABLED and filters.get("incremental")
+    if RESULT_CACHE_ENABLED and not filters.get("incremental"):
+        cache_key = canonical_search_key(filters, user_keywords_str)
+        cached = result_cache.lookup(cache_key, lambda: _compute_analysis(filters, user_keywords_str, use_store=False),
+                                     _cacheable)
+    if cached is not None: # Cached results are analyzed and scored already
+        (response_body, _), cache_status, age = cached
+        events = ({"type": "property", "property": details} for details in response_body["results"])
+    else:
+        cache_status, age = (CACHE_MISS if cache_key else CACHE_BYPASS), 0.0
+        stored = _stored_listings(filters, need_description) if LISTING_STORE_ENABLED and not incremental else None
+        if stored:
+            events = ({"type": "property", "property": details} for details in analyze_listings(stored, user_keywords_str))
+        else:
+            events = iter_daft_listings(
+                filters, user_keywords_str, need_description=need_description,
+                known_details=_known_details if LISTING_STORE_ENABLED else None,
+                previous_listings=_previous_listings if incremental else None,
+            )
+    for event in events:
+        if event["type"] == "property":
+            count += 1
+            properties.append(event["property"])
+            if options["fields"] or options["description_length"]:
+                event = dict(event, property=shape_listing(event["property"], options["fields"], options["description_length"]))
+        elif event["type"] == "error":
+            errors.append(event)
+        elif event["type"] == "stopped":
+            stopped_at = event["page"]
+        yield _ndjson_line(event)
+
+    results = properties
+    if properties and cached is None: # Value scores compare listings with each other, so they come once everything is in
+        from src.lib.valuation import score_listings # NumPy loads on the first scored search, not at startup
+
+        with timed("valuation"):
+            results = score_listings(properties)
+    if results:
+        scored = [{"url": details["url"], "valuation": details["valuation"], "analysis_tags": details["analysis_tags"]}
+                  for details in results if "valuation" in details]
+        yield _ndjson_line({"type": "valuation", "listings": scored})
+
+    if cached is None:
+        if LISTING_STORE_ENABLED and properties and not stored: # Also matches the new batch against saved searches
+            _store_listings(filters, properties, need_description, complete=not incremental and not _page_failed(errors))
+        if cache_key and not errors: # Cached without an email, as cached_analysis does; a partial crawl isn't kept
+            message = _completion_message(count, None) if count else NO_RESULTS_MESSAGE
+            result_cache.put(cache_key, ({"message": message, "results": results}, 200))
+    if results and options["description_length"]:
+        result_sets.put(results) # Keeps the full descriptions for /api/listings/<id>/description
 
-    print(f"[main.py] Received API request data: {data}")
+    message = _completion_message(count, email) if count else NO_RESULTS_MESSAGE
+    logger.info("Finished streaming response. Results count: %d", count)
+    summary = {"type": "summary", "message": message, "count": count, "errors": errors,
+               "cache": {"status": cache_status, "age": round(age, 1)}}
+    if stopped_at is not None:
+        _mark_stopped(summary, stopped_at)
+    yield _ndjson_line(summary)
 
-    # Extract filters for the daft_analyzer module
-    filters = {
+def _ndjson_line(event):
+    with timed("serialize"):
+        return dumps(event) + b"\n"
+
+def _filters_from_request(data):
+    """Extracts filters for the daft_analyzer module from the request JSON."""
+    return {
         "location": data.get("location"),
         "propertyType": data.get("propertyType"),
         "minPrice": data.get("minPrice"),
         "maxPrice": data.get("maxPrice"),
         "minBeds": data.get("minBeds"),
         "maxBeds": data.get("maxBeds"),
+        "max_pages": data.get("maxPages") or None, # A page count or "all"; unset uses DAFT_MAX_PAGES
+        "incremental": bool(data.get("incremental")), # Re-crawl only new/changed listings until an unchanged page
         # Keywords from the form will be passed to analyze_listings
     }
-    user_keywords_str = data.get("keywords", "")
 
-    # Step 1: Fetch listings using daft_analyzer
-    print(f"[main.py] Calling fetch_daft_listings with filters: {filters}")
-    fetched_data = fetch_daft_listings(filters)
+def _stored_listings(filters, need_description):
+    """Returns stored listings for a search crawled within LISTING_MAX_AGE, or None."""
+    try:
+        crawled_count = listing_store.fresh_search_count(canonical_search_key(filters), need_description, LISTING_MAX_AGE)
+        if not crawled_count:
+            return None
+        stored = listing_store.query_listings(filters, LISTING_MAX_AGE)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Listing store query failed, scraping live: %s", e)
+        return None
+    if len(stored) < crawled_count: # Some crawled listings don't match the stored columns; don't drop them
+        logger.info("Listing store has %d of %d listings for filters, scraping live.", len(stored), crawled_count)
+        return None
+    logger.info("Serving %d listings from the listing store for filters: %s", len(stored), filters)
+    return stored
+
+def _known_details(urls):
+    """Detail pages the store already has, so the crawl only fetches the gaps."""
+    try:
+        return listing_store.get_complete_details(urls, LISTING_MAX_AGE)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Listing store lookup failed: %s", e)
+        return {}
+
+def _previous_listings(urls):
+    """Listings from earlier crawls, of any age, for an incremental re-crawl to compare against."""
+    try:
+        return listing_store.get_stored_details(urls)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Listing store lookup failed: %s", e)
+        return {}
+
+def _page_failed(errors):
+    """Whether a results page failed, leaving its listings out of the crawl."""
+    return any("page" in error for error in errors)
+
+def _store_listings(filters, listings, need_description, complete=True):
+    try:
+        listing_store.upsert_listings(listings)
+        # An incremental crawl that stopped early, or one with a failed results page, doesn't
+        # hold every result of the search, so it isn't recorded as the search's answer
+        if complete:
+            listing_store.record_search(canonical_search_key(filters), len(listings), with_descriptions=need_description)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Could not save listings to the store: %s", e)
+    _check_alerts(listings)
+
+def _check_alerts(listings):
+    """Matches a crawled batch against every saved search at once, instead of re-crawling per saved search."""
+    if not ALERTS_ENABLED:
+        return
+    try:
+        alerts.process_listings(listings)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Saved-search alerts failed for this batch: %s", e)
+
+def run_analysis(filters, user_keywords_str, email=None, use_store=True):
+    """
+    Fetches and analyzes listings. Returns (response_body, status_code). With use_store
+    false a recently crawled search is crawled again instead of served from the store.
+    """
+    # Detail pages are fetched for user keywords (or DAFT_FETCH_DETAILS); otherwise tags see the snippet
+    need_description = needs_description(filters, user_keywords_str)
+    scrape_errors = [] # Results and detail pages that failed without aborting the crawl
+    stopped = [] # Where an incremental crawl stopped early, if it did
+
+    # Step 1: Answer from the listing store if this search was crawled recently, else fetch using daft_analyzer
+    # An incremental re-crawl always goes to Daft, but only fetches listings that changed since the stored crawl
+    incremental = LISTING_STORE_ENABLED and filters.get("incremental")
+    fetched_data = None
+    if LISTING_STORE_ENABLED and use_store and not incremental:
+        fetched_data = _stored_listings(filters, need_description)
+    if not fetched_data:
+        logger.debug("Calling fetch_daft_listings with filters: %s", filters)
+        fetched_data = fetch_daft_listings(
+            filters, errors=scrape_errors, need_description=need_description,
+            known_details=_known_details if LISTING_STORE_ENABLED else None,
+            previous_listings=_previous_listings if incremental else None, stopped=stopped,
+        )
+        if LISTING_STORE_ENABLED and isinstance(fetched_data, list):
+            _store_listings(filters, fetched_data, need_description,
+                            complete=not incremental and not _page_failed(scrape_errors))
 
     if isinstance(fetched_data, dict) and 'error' in fetched_data:
-        print(f"[main.py] Error from fetch_daft_listings: {fetched_data['error']}")
-        return jsonify(fetched_data), 500 # Propagate error to frontend
+        logger.error("Error from fetch_daft_listings: %s", fetched_data['error'])
+        return fetched_data, 500 # Propagate error to frontend
     
     if not fetched_data:
-        print("[main.py] No listings fetched or an empty list was returned.")
-        return jsonify({"message": "No properties found matching your criteria from Daft.ie.", "results": []})
+        logger.info("No listings fetched or an empty list was returned.")
+        response_body = {"message": NO_RESULTS_MESSAGE, "results": []}
+        if scrape_errors: # e.g. results page 1 failed, so "no properties" isn't known
+            response_body["errors"] = scrape_errors
+        return response_body, 200
 
     # Step 2: Analyze the fetched listings
-    print(f"[main.py] Calling analyze_listings for {len(fetched_data)} listings. User keywords: '{user_keywords_str}'")
+    logger.debug("Calling analyze_listings for %d listings. User keywords: '%s'", len(fetched_data), user_keywords_str)
     analyzed_results = analyze_listings(fetched_data, user_keywords_str)
     
     if isinstance(analyzed_results, dict) and 'error' in analyzed_results: # Should not happen if fetch was ok
-        print(f"[main.py] Error from analyze_listings: {analyzed_results['error']}")
-        return jsonify(analyzed_results), 500
+        logger.error("Error from analyze_listings: %s", analyzed_results['error'])
+        return analyzed_results, 500
 
-    message = f"Analysis complete. Found and analyzed {len(analyzed_results)} properties."
-    email = data.get('email')
-    if email:
-        message += f" If this were live, an email notification would be sent to {email}."
-        # Placeholder for actual email sending logic
-        # send_email(email, "Property Analysis Results", f"Your analysis is complete. Results: {analyzed_results}")
-        print(f"[main.py] Email sending to {email} would happen here with actual results.")
+    # Step 3: Score each listing's price against comparable listings in the result set
+    from src.lib.valuation import score_listings # NumPy loads on the first scored search, not at startup
+
+    with timed("valuation"):
+        analyzed_results = score_listings(analyzed_results)
+
+    message = _completion_message(len(analyzed_results), email)
+
+    logger.info("Analysis finished. Results count: %d", len(analyzed_results))
+    response_body = {"message": message, "results": analyzed_results}
+    if scrape_errors:
+        response_body["errors"] = scrape_errors
+    if stopped:
+        _mark_stopped(response_body, stopped[0]["page"])
+    return response_body, 200
+
+# Whole analysis results by canonical search, in front of the store and the crawl (RESULT_CACHE=0 turns it off)
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE', '1') != '0'
+result_cache = ResultCache(
+    ttl=float(os.getenv('RESULT_CACHE_TTL', DEFAULT_RESULT_CACHE_TTL)),
+    stale_ttl=float(os.getenv('RESULT_CACHE_STALE', DEFAULT_STALE_SECONDS)),
+    max_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', DEFAULT_RESULT_CACHE_BYTES)),
+)
+
+def _cacheable(result):
+    response_body, status_code = result
+    # A crawl with failed results or detail pages is retried next time
+    return status_code == 200 and not response_body.get("errors")
+
+def _compute_analysis(filters, user_keywords_str, use_store=True):
+    """
+    run_analysis for the result cache: without an email, and with an app context for background
+    refreshes. Refreshes pass use_store=False, so a stale entry is re-crawled rather than
+    replaced by the same stored listings under a new age.
+    """
+    with app.app_context():
+        return run_analysis(filters, user_keywords_str, use_store=use_store)
+
+def cached_analysis(filters, user_keywords_str, email=None):
+    """
+    run_analysis behind the result cache. Returns (response_body, status_code, cache_info),
+    where cache_info is {"status": hit/stale/miss/bypass, "age": seconds}. Incremental
+    re-crawls always go to Daft.
+    """
+    if not RESULT_CACHE_ENABLED or filters.get("incremental"):
+        response_body, status_code = run_analysis(filters, user_keywords_str, email)
+        return response_body, status_code, {"status": CACHE_BYPASS, "age": 0.0}
+
+    (response_body, status_code), status, age = result_cache.get(
+        canonical_search_key(filters, user_keywords_str), lambda: _compute_analysis(filters, user_keywords_str), _cacheable,
+        refresh=lambda: _compute_analysis(filters, user_keywords_str, use_store=False))
+    if status_code == 200 and response_body.get("results"): # Cached without an email; the message names this one
+        response_body = dict(response_body, message=_completion_message(len(response_body["results"]), email))
+    return response_body, status_code, {"status": status, "age": round(age, 1)}
+
+# Background analysis jobs; identical in-flight searches share one crawl. A job is shared by
+# everyone who submitted the search, so it runs without an email; the result route adds the caller's.
+def _run_analysis_job(filters, user_keywords_str):
+    with app.app_context(): # Job threads need one for the listing store
+        response_body, status_code, cache_info = cached_analysis(filters, user_keywords_str)
+        return dict(response_body, cache=cache_info), status_code
+
+# Full result sets behind paged or truncated responses, for later pages and full descriptions
+result_sets = ResultSets(
+    ttl=float(os.getenv("RESULT_SET_TTL", DEFAULT_RESULT_SET_TTL_SECONDS)),
+    max_sets=int(os.getenv("RESULT_SET_MAX", DEFAULT_MAX_RESULT_SETS)),
+)
+
+def _shaped_body(response_body, options, result_id=None):
+    """
+    Applies the fields, limit and descriptionLength options to a response's results. Paged
+    or truncated results are kept in result_sets (under result_id, if given) for the
+    cursor and the full descriptions.
+    """
+    results = response_body.get("results")
+    if not isinstance(results, list) or not (options["fields"] or options["limit"] or options["description_length"]):
+        return response_body
+    if options["limit"] or options["description_length"]:
+        result_id = result_sets.put(results, result_id)
+    page = page_of(results, 0, options["limit"], result_id, options["fields"], options["description_length"])
+    return dict(response_body, **page)
+
+def _cursor_page(options):
+    """The page of a kept result set that options["cursor"] points at, as (body, status)."""
+    try:
+        result_id, offset = decode_cursor(options["cursor"])
+    except ValueError as e:
+        return {"error": "Invalid request", "details": str(e)}, 400
+    results = result_sets.get(result_id)
+    if results is None:
+        return {"error": "Cursor expired", "details": "Run the search again to page through its results"}, 410
+    return page_of(results, offset, options["limit"], result_id, options["fields"], options["description_length"]), 200
+
+def _json_response(body, status_code=200):
+    with timed("serialize"):
+        payload = dumps(body)
+    return Response(payload, status=status_code, mimetype="application/json")
+
+job_manager = JobManager(
+    _run_analysis_job,
+    max_workers=int(os.getenv("ANALYSIS_JOB_WORKERS", DEFAULT_JOB_WORKERS)),
+    result_ttl=float(os.getenv("ANALYSIS_JOB_RESULT_TTL", DEFAULT_RESULT_TTL_SECONDS)),
+)
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_properties_route(): # Renamed to avoid conflict with imported function if any
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid request", "details": "No JSON data received"}), 400
+
+    try:
+        options = payload_options(data)
+    except ValueError as e:
+        return jsonify({"error": "Invalid request", "details": str(e)}), 400
+    if options["cursor"]: # A later page of an earlier search; nothing is crawled
+        return _json_response(*_cursor_page(options))
+
+    filters = _filters_from_request(data)
+    user_keywords_str = data.get("keywords", "")
+    logger.debug("Received analyze request with filters: %s", filters)
+
+    if _wants_stream(data):
+        logger.info("Streaming analysis with filters: %s", filters)
+        return Response(
+            stream_with_context(_stream_analysis(filters, user_keywords_str, data.get('email'), options)),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # Don't let proxies buffer the stream
+        )
+
+    with collect_timings() as timings:
+        response_body, status_code, cache_info = cached_analysis(filters, user_keywords_str, data.get('email'))
+        response_body = dict(response_body, cache=cache_info)
+        if status_code == 200:
+            response_body = _shaped_body(response_body, options)
+        with timed("serialize"):
+            payload = dumps(response_body)
+    if _wants_timings(data): # Added after the fact so the breakdown can include serializing the results
+        payload = _with_timings(payload, timings.to_dict())
+    response = Response(payload, status=status_code, mimetype="application/json")
+    response.headers['X-Cache'] = cache_info["status"].upper()
+    response.headers['Age'] = str(int(cache_info["age"]))
+    return response
+
+def _wants_timings(data):
+    """A per-stage timing breakdown is added with {"timings": true} or ?timings=1."""
+    return bool(data.get("timings")) or request.args.get("timings") == "1"
+
+def _with_timings(payload, timings):
+    """Adds a "timings" key to an already serialized JSON object (bytes)."""
+    separator = b"," if payload.strip() != b"{}" else b""
+    return payload.rstrip()[:-1] + separator + b'"timings":' + dumps(timings) + b"}"
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    """Counters and stage/request timing histograms in the Prometheus text format."""
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request_time(response):
+    # Streaming responses are timed until their first byte, not until the stream ends
+    if request.endpoint and request.endpoint not in ('metrics_route', 'static') and 'request_started' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=request.endpoint)
+    return response
+
+@app.route('/api/comparables', methods=['POST'])
+def comparables_route():
+    """Price statistics per area and property type over the stored listings matching the filters."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid request", "details": "No JSON data received"}), 400
+    if not LISTING_STORE_ENABLED:
+        return jsonify({"error": "Listing store unavailable", "details": "Comparables are computed from stored listings"}), 503
+
+    filters = _filters_from_request(data)
+    max_age = float(data.get("maxAgeSeconds") or COMPARABLES_MAX_AGE)
+    try:
+        stored = listing_store.query_listings(filters, max_age)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Listing store query failed: %s", e)
+        return jsonify({"error": "Listing store query failed", "details": str(e)}), 500
+    logger.info("Computing comparables over %d stored listings for filters: %s", len(stored), filters)
+    from src.lib.valuation import area_statistics
+    return jsonify({"listings": len(stored), "groups": area_statistics(stored)})
+
+def _alerts_unavailable():
+    return jsonify({"error": "Saved searches unavailable", "details": "Saved searches need the listing store's database"}), 503
+
+@app.route('/api/saved-searches', methods=['POST'])
+def create_saved_search():
+    """
+    Saves the analyze filters and keywords for an email; new matching listings are sent as alerts.
+    The response's "token" is needed to list or delete the search and is not shown again.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid request", "details": "No JSON data received"}), 400
+    email = (data.get("email") or "").strip()
+    if "@" not in email:
+        return jsonify({"error": "Invalid request", "details": "A valid email is required for alerts"}), 400
+    if not ALERTS_ENABLED:
+        return _alerts_unavailable()
+    try:
+        search, token = alerts.save_search(email, _filters_from_request(data), data.get("keywords", ""), data.get("name", ""))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Could not save search: %s", e)
+        return jsonify({"error": "Could not save search", "details": str(e)}), 500
+    logger.info("Saved search %d for %s", search.id, email)
+    return jsonify(dict(search.to_dict(), token=token)), 201
+
+def _search_tokens():
+    """Saved-search tokens from the X-Search-Token header and any ?token= args."""
+    tokens = request.args.getlist("token") + [request.headers.get("X-Search-Token", "")]
+    return [token.strip() for token in tokens if token.strip()]
+
+@app.route('/api/saved-searches', methods=['GET'])
+def list_saved_searches():
+    """The active saved searches the given tokens were issued for."""
+    tokens = _search_tokens()
+    if not tokens:
+        return jsonify({"error": "Invalid request", "details": "token is required"}), 400
+    if not ALERTS_ENABLED:
+        return _alerts_unavailable()
+    return jsonify({"saved_searches": [search.to_dict() for search in alerts.list_searches(tokens)]})
+
+@app.route('/api/saved-searches/<int:search_id>', methods=['DELETE'])
+def delete_saved_search(search_id):
+    tokens = _search_tokens()
+    if not ALERTS_ENABLED:
+        return _alerts_unavailable()
+    if not tokens or not alerts.delete_search(search_id, tokens[0]):
+        return jsonify({"error": "Unknown saved search", "details": "No saved search with this id for this token"}), 404
+    return "", 204
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_analysis_job():
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid request", "details": "No JSON data received"}), 400
+
+    filters = _filters_from_request(data)
+    user_keywords_str = data.get("keywords", "")
+    # The email only changes the message text, so it stays out of the job and its de-duplication key
+    job, coalesced = job_manager.submit(canonical_search_key(filters, user_keywords_str), filters, user_keywords_str)
+    logger.info("Analysis job %s %s for filters: %s", job.id, 'joined' if coalesced else 'queued', filters)
+
+    job_info = job.to_dict()
+    job_info["coalesced"] = coalesced
+    job_info["status_url"] = url_for('analysis_job_status', job_id=job.id)
+    job_info["result_url"] = url_for('analysis_job_result', job_id=job.id, email=data.get('email') or None)
+    return jsonify(job_info), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def analysis_job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job", "details": "Job not found or its result has expired"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def analysis_job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job", "details": "Job not found or its result has expired"}), 404
+    if job.status == JOB_FAILED:
+        return jsonify({"error": "Analysis failed", "details": job.error}), 500
+    if not job.finished:
+        return jsonify(job.to_dict()), 202
+    try:
+        options = payload_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": "Invalid request", "details": str(e)}), 400
+    if options["cursor"]:
+        return _json_response(*_cursor_page(options))
+    response_body, status_code = job.result
+    if status_code == 200 and response_body.get("results"): # The message names this caller's email (?email=), if any
+        response_body = dict(response_body, message=_completion_message(len(response_body["results"]), request.args.get("email")))
+    if status_code == 200:
+        response_body = _shaped_body(response_body, options, result_id=job.id)
+    return _json_response(response_body, status_code)
+
+@app.route('/api/listings/search', methods=['GET'])
+def search_listings_route():
+    """
+    Full-text search over every stored listing, most relevant first: ?q= with words, "phrases",
+    prefix* terms and comma separated alternatives, plus the analyze filters, limit, offset,
+    fields and descriptionLength as query args.
+    """
+    if not FULLTEXT_ENABLED:
+        return jsonify({"error": "Search unavailable", "details": "Full-text search needs the SQLite listing store"}), 503
+    query = request.args.get("q", "")
+    try:
+        options = payload_options(request.args)
+        offset = request.args.get("offset") or "0"
+        if not offset.isdigit():
+            raise ValueError("offset must be a non-negative integer")
+        offset = int(offset)
+        with timed("search"):
+            results, total = fulltext.search_listings(query, _filters_from_request(request.args),
+                                                      limit=options["limit"] or fulltext.DEFAULT_SEARCH_LIMIT, offset=offset)
+    except ValueError as e:
+        return jsonify({"error": "Invalid request", "details": str(e)}), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Full-text search failed: %s", e)
+        return jsonify({"error": "Search failed", "details": str(e)}), 500
+    if options["fields"] or options["description_length"]:
+        fields = options["fields"] and options["fields"] + ("relevance", "snippet")
+        results = [shape_listing(details, fields, options["description_length"]) for details in results]
+    return _json_response({"query": query, "total": total, "offset": offset, "results": results})
+
+@app.route('/api/listings/<listing_id>/description', methods=['GET'])
+def listing_description_route(listing_id):
+    """The full description of a listing returned truncated (see descriptionLength)."""
+    details = result_sets.find_listing(listing_id)
+    if details is None and LISTING_STORE_ENABLED:
+        try:
+            details = listing_store.get_listing(listing_id)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.warning("Listing store lookup failed: %s", e)
+    if details is None:
+        return jsonify({"error": "Unknown listing", "details": "Listing not found in recent results or the store"}), 404
+    return jsonify({
+        "listing_id": listing_id,
+        "description": details.get("description", ""),
+        "description_complete": details.get("description_complete", True),
+    })
+
+@app.route('/api/listings/<listing_id>/price-history', methods=['GET'])
+def listing_price_history_route(listing_id):
+    """The price changes recorded for a stored listing, oldest first."""
+    if not LISTING_STORE_ENABLED:
+        return jsonify({"error": "Listing store unavailable", "details": "Price history is recorded by the listing store"}), 503
+    try:
+        changes = listing_store.price_history(listing_id)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error("Price history lookup failed: %s", e)
+        return jsonify({"error": "Price history unavailable", "details": str(e)}), 500
+    return jsonify({"listing_id": listing_id, "changes": changes})
+
+# Compressed when the client accepts it; streams are left alone so events aren't held back
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/plain")
 
-    print(f"[main.py] Sending response to frontend. Message: {message}, Results count: {len(analyzed_results)}")
-    return jsonify({"message": message, "results": analyzed_results})
+@app.after_request
+def _compress_response(response):
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.status_code < 200 or response.status_code in (204, 304)):
+        return response
+    response.vary.add('Accept-Encoding')
+    with timed("compress"):
+        body, encoding = compress(response.get_data(), request.headers.get('Accept-Encoding', ''))
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
 
 if __name__ == '__main__':
     # Ensure the venv is active and daft-scraper is installed: 
@@ -0,0 +1,66 @@
+import json
+from datetime import datetime
+
+from src.models.user import db
+
+class Listing(db.Model):
+    """A scraped Daft listing, keyed by Daft's listing id, with indexed filter columns."""
+    listing_id = db.Column(db.String(32), primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    title = db.Column(db.String(300), nullable=False, default="")
+    price = db.Column(db.String(80), nullable=False, default="") # As shown on Daft, e.g. "AMV: €250,000"
+    price_value = db.Column(db.Integer, index=True) # Parsed euros, None for "Price on application"
+    beds = db.Column(db.Integer, index=True)
+    baths = db.Column(db.Integer)
+    county = db.Column(db.String(80), index=True)
+    area = db.Column(db.String(120), index=True)
+    property_type = db.Column(db.String(80), index=True)
+    ber = db.Column(db.String(20), index=True)
+    description = db.Column(db.Text, nullable=False, default="")
+    description_complete = db.Column(db.Boolean, nullable=False, default=False)
+    details_json = db.Column(db.Text, nullable=False, default="{}") # The full details dict as scraped
+    scraped_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    tags = db.relationship('ListingTag', backref='listing', lazy='selectin', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_listing_county_type_price', 'county', 'property_type', 'price_value'),
+    )
+
+    def __repr__(self):
+        return f'<Listing {self.listing_id}>'
+
+    def to_dict(self):
+        details = json.loads(self.details_json)
+        details["analysis_tags"] = [tag.tag for tag in self.tags]
+        return details
+
+class ListingTag(db.Model):
+    """One analysis tag of a listing, so listings can be filtered by tag through an index."""
+    listing_id = db.Column(db.String(32), db.ForeignKey('listing.listing_id', ondelete='CASCADE'), primary_key=True)
+    tag = db.Column(db.String(80), primary_key=True, index=True)
+
+class ListingPriceChange(db.Model):
+    """A change of a listing's parsed price between two crawls."""
+    id = db.Column(db.Integer, primary_key=True)
+    listing_id = db.Column(db.String(32), db.ForeignKey('listing.listing_id', ondelete='CASCADE'), nullable=False, index=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    old_price = db.Column(db.String(80), nullable=False, default="")
+    new_price = db.Column(db.String(80), nullable=False, default="")
+    old_value = db.Column(db.Integer, nullable=False)
+    new_value = db.Column(db.Integer, nullable=False)
+
+    def to_dict(self):
+        return {
+            'listing_id': self.listing_id,
+            'changed_at': self.changed_at.isoformat(),
+            'old_price': self.old_price,
+            'new_price': self.new_price,
+            'delta': self.new_value - self.old_value
+        }
+
+class SearchSnapshot(db.Model):
+    """When a canonical search was last crawled live, so repeats can be answered from the store."""
+    search_key = db.Column(db.String(64), primary_key=True) # sha256 of canonical_search_key
+    crawled_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    with_descriptions = db.Column(db.Boolean, nullable=False, default=False)
+    result_count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,46 @@
+import json
+from datetime import datetime
+
+from src.models.user import db
+
+class SavedSearch(db.Model):
+    """A user's search (the analyze filters plus keywords) that is matched against newly crawled listings."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(120), nullable=False, default="")
+    filters_json = db.Column(db.Text, nullable=False, default="{}")
+    keywords = db.Column(db.String(500), nullable=False, default="")
+    # SHA-256 of the token returned when the search is created; listing and deleting need the token
+    token_hash = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Bumped on every change, deletes included (they only clear `active`), so the alert index knows to rebuild
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    user = db.relationship('User', lazy='joined')
+
+    def __repr__(self):
+        return f'<SavedSearch {self.id}>'
+
+    @property
+    def filters(self):
+        return json.loads(self.filters_json)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'email': self.user.email,
+            'filters': self.filters,
+            'keywords': self.keywords,
+            'created_at': self.created_at.isoformat(),
+        }
+
+class AlertMatch(db.Model):
+    """A listing that matched a saved search; notified_at stays empty until the alert has been sent."""
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_search.id', ondelete='CASCADE'), primary_key=True)
+    listing_id = db.Column(db.String(32), primary_key=True, index=True)
+    url = db.Column(db.String(500), nullable=False, default="")
+    title = db.Column(db.String(300), nullable=False, default="")
+    price = db.Column(db.String(80), nullable=False, default="")
+    matched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    notified_at = db.Column(db.DateTime, index=True)
@@ -20,6 +20,7 @@ document.addEventListener("DOMContentLoaded", () => {
             minBeds: formData.get("minBeds"),
             maxBeds: formData.get("maxBeds"),
             keywords: formData.get("keywords"),
+            maxPages: formData.get("maxPages"),
         };
 
         try {
@@ -27,8 +28,15 @@ document.addEventListener("DOMContentLoaded", () => {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
+                    "Accept": "application/x-ndjson",
                 },
-                body: JSON.stringify(searchParams),
+                // Only the fields shown here, with short descriptions; the rest is fetched on demand
+                body: JSON.stringify({
+                    ...searchParams,
+                    stream: true,
+                    fields: ["url", "title", "price", "description"],
+                    descriptionLength: 300,
+                }),
             });
 
             if (!response.ok) {
@@ -36,19 +44,67 @@ document.addEventListener("DOMContentLoaded", () => {
                 throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
+            const heading = document.createElement("h3");
+            const progress = document.createElement("p");
+            const ul = document.createElement("ul");
+            resultsContent.innerHTML = "";
+            resultsContent.append(heading, progress, ul);
+            const listItems = new Map(); // url -> <li>, to add value scores once they arrive
 
-            resultsContent.innerHTML = `<h3>${data.message}</h3>`;
-            if (data.results && data.results.length > 0) {
-                const ul = document.createElement("ul");
-                data.results.forEach(property => {
+            // Each line of the response is one JSON event; render results as they arrive
+            const handleEvent = (event) => {
+                if (event.type === "page") {
+                    const of = event.max_pages ? ` of ${event.max_pages}` : "";
+                    progress.textContent = `Scanning results page ${event.page}${of} (${event.listings} listings)...`;
+                } else if (event.type === "property") {
+                    const property = event.property;
                     const li = document.createElement("li");
-                    li.innerHTML = `<strong><a href="${property.url}" target="_blank">${property.title}</a></strong> - ${property.price}<br>${property.description}`;
+                    li.innerHTML = `<strong><a href="${property.url}" target="_blank">${property.title}</a></strong> - ${property.price} <em class="value-score"></em><br><span class="description">${property.description}</span>`;
+                    if (property.description_truncated) {
+                        const more = document.createElement("a");
+                        more.href = "#";
+                        more.textContent = " Show full description";
+                        more.addEventListener("click", async (clickEvent) => {
+                            clickEvent.preventDefault();
+                            const descriptionResponse = await fetch(`/api/listings/${encodeURIComponent(property.listing_id)}/description`);
+                            if (descriptionResponse.ok) {
+                                const { description } = await descriptionResponse.json();
+                                li.querySelector(".description").textContent = description;
+                                more.remove();
+                            }
+                        });
+                        li.appendChild(more);
+                    }
+                    listItems.set(property.url, li);
                     ul.appendChild(li);
-                });
-                resultsContent.appendChild(ul);
-            } else if (!data.message && !(data.results && data.results.length > 0)) {
-                resultsContent.innerHTML = "<p>No properties found matching your criteria, or an error occurred.</p>";
+                    heading.textContent = `Found ${ul.children.length} properties so far...`;
+                } else if (event.type === "valuation") {
+                    event.listings.forEach(({ url, valuation }) => {
+                        const li = listItems.get(url);
+                        if (li && valuation.value_score !== null) {
+                            li.querySelector(".value-score").textContent =
+                                `Value score ${valuation.value_score} (${valuation.comparables} comparables, median ${valuation.metric.replace(/_/g, " ")} €${valuation.group_median.toLocaleString()})`;
+                        }
+                    });
+                } else if (event.type === "summary") {
+                    heading.textContent = event.message;
+                    progress.textContent = event.errors && event.errors.length ? `${event.errors.length} pages could not be loaded.` : "";
+                }
+            };
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = "";
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split("\n");
+                buffered = lines.pop();
+                lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+            }
+            if (buffered.trim()) {
+                handleEvent(JSON.parse(buffered));
             }
 
         } catch (error) {